@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Benchmarks for the decode, scoring and display hot paths.
+
+    python benchmarks/bench.py --output results.json
+    python benchmarks/bench.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench.py --baseline benchmarks/baseline.json
+
+Results are JSON (median and minimum wall time of each case). When a baseline
+is given, every case slower than the baseline by more than --tolerance is
+reported and the exit status is 1, so regressions show up before a release.
+Test videos are generated with ffmpeg's test source into a temporary folder.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+
+import framestore  # noqa: E402
+import rating  # noqa: E402
+from frames import VideoFrameSource  # noqa: E402
+
+THRESHOLD = 5
+SYNTHETIC_SIZES = [(100, 100), (640, 360), (1920, 1080)]
+WINDOW_SIZES = [5, 25, 100]
+VIDEO_SIZES = [(640, 360), (1920, 1080)]
+VIDEO_SECONDS = 4
+VIDEO_FPS = 25
+MIN_RUN_S = 0.05
+
+
+def measure(results, name, func, repeat, warmup=1, **info):
+    for _ in range(warmup):
+        func()
+    # Sub-millisecond cases are looped so each timed run lasts at least MIN_RUN_S
+    number = 1
+    if warmup:
+        start = time.perf_counter()
+        func()
+        number = max(1, int(MIN_RUN_S / max(time.perf_counter() - start, 1e-9)))
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    results[name] = {"median_s": statistics.median(times), "min_s": min(times), "runs": repeat, "loops": number, **info}
+    print(f"{name:45s} {results[name]['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+
+
+def synthetic_frame(width, height, seed=0):
+    # Smooth gradients plus noise, closer to camera footage than pure noise
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 / width, y * 255 / height, (x + y) * 127 / (width + height)], axis=-1)
+    return np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+
+
+def make_test_video(folder, width, height):
+    from moviepy.config import get_setting
+    path = os.path.join(folder, f"testsrc_{width}x{height}.mp4")
+    subprocess.run([
+        get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=duration={VIDEO_SECONDS}:size={width}x{height}:rate={VIDEO_FPS}",
+        "-pix_fmt", "yuv420p", path,
+    ], check=True)
+    return path
+
+
+class ArrayFrameSource:
+    """In-memory frames with the VideoFrameSource interface, to time scoring without decoding."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.frame_count = len(frames)
+
+    def get_image(self, index):
+        return Image.fromarray(self.frames[index])
+
+
+def bench_rating(results, repeat):
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, "imgs_exemplo", "*.png"))):
+        img = Image.open(path).convert("RGB")
+        measure(results, f"imageRating/{os.path.basename(path)}", lambda: rating.image_rating(img, THRESHOLD),
+                repeat, width=img.width, height=img.height)
+    for width, height in SYNTHETIC_SIZES:
+        frame = synthetic_frame(width, height)
+        measure(results, f"imageRating/synthetic_{width}x{height}", lambda: rating.image_rating(frame, THRESHOLD),
+                repeat, width=width, height=height)
+
+
+def bench_best_frame(results, repeat, workers):
+    frames = [synthetic_frame(640, 360, seed) for seed in range(max(WINDOW_SIZES))]
+    source = ArrayFrameSource(frames)
+    for window in WINDOW_SIZES:
+        center = len(frames) // 2
+        measure(results, f"getBestFrame/window_{window}",
+                lambda: rating.find_best_frame(source, center, window, THRESHOLD, workers),
+                repeat, window=window, workers=workers)
+
+
+def bench_loading(results, repeat, video_folder):
+    for width, height in VIDEO_SIZES:
+        path = make_test_video(video_folder, width, height)
+        frame_count = VIDEO_SECONDS * VIDEO_FPS
+
+        def sequential(max_size=None):
+            source = VideoFrameSource(path, max_size=max_size)
+            for index in range(source.frame_count):
+                source.get_frame(index)
+            source.close()
+
+        def mapped_sequential():
+            source = framestore.open_store(path, (640, 360))
+            for index in range(source.frame_count):
+                source.get_frame(index).sum()  # Touch the pixels, a slice alone reads nothing
+            source.close()
+
+        def random_access():
+            source = VideoFrameSource(path)
+            for index in np.random.default_rng(0).integers(0, source.frame_count, 10):
+                source.get_frame(int(index))
+            source.close()
+
+        name = f"load/{width}x{height}"
+        measure(results, f"{name}/sequential", sequential, repeat, warmup=0, frames=frame_count)
+        measure(results, f"{name}/proxy_640x360", lambda: sequential((640, 360)), repeat, warmup=0, frames=frame_count)
+        measure(results, f"{name}/random_10", random_access, repeat, warmup=0, frames=10)
+        write_store(path, (640, 360))
+        measure(results, f"{name}/mapped_640x360", mapped_sequential, repeat, frames=frame_count)
+        for case in ("sequential", "proxy_640x360", "mapped_640x360"):
+            entry = results[f"{name}/{case}"]
+            entry["frames_per_s"] = frame_count / entry["median_s"]
+
+
+def write_store(path, max_size):
+    source = VideoFrameSource(path, max_size=max_size)
+    writer = framestore.create_writer(source, max_size, 1024 ** 3)
+    for index in range(source.frame_count):
+        writer.write(index, source.get_frame(index))
+    writer.finish()
+    source.close()
+
+
+def bench_pixbuf(results, repeat):
+    try:
+        import gi
+        gi.require_version("GdkPixbuf", "2.0")
+        from gi.repository import GdkPixbuf, GLib
+    except (ImportError, ValueError):
+        print("GdkPixbuf not available, skipping pixbuf benchmarks", file=sys.stderr)
+        return
+    for width, height in SYNTHETIC_SIZES:
+        frame = synthetic_frame(width, height)
+
+        def convert_pil():
+            # Conversion used before frames were handed over as arrays
+            image = Image.fromarray(frame)
+            GdkPixbuf.Pixbuf.new_from_data(
+                image.tobytes(), GdkPixbuf.Colorspace.RGB, False, 8,
+                image.width, image.height, image.width * 3
+            )
+
+        def convert_frame():
+            # Same conversion as framestop.pixbuf_from_frame
+            GdkPixbuf.Pixbuf.new_from_bytes(
+                GLib.Bytes.new(frame.tobytes()), GdkPixbuf.Colorspace.RGB, False, 8,
+                width, height, width * 3
+            )
+
+        measure(results, f"pixbuf/from_pil_{width}x{height}", convert_pil, repeat, width=width, height=height)
+        measure(results, f"pixbuf/from_frame_{width}x{height}", convert_frame, repeat, width=width, height=height)
+
+
+CORE_MODULES = "frames, rating, bulk, export, sharpness, scenes, framestore, loader, timing"
+
+
+def bench_startup(results, repeat, startup_command):
+    src_dir = os.path.join(REPO_DIR, "src")
+
+    def import_core():
+        # Everything the GUI imports before its window appears, except GTK itself
+        subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {src_dir!r}); import {CORE_MODULES}"],
+                       check=True)
+
+    measure(results, "startup/import_core", import_core, repeat, warmup=1)
+
+    # Time to window needs a display; the command can be the Flatpak (flatpak run io.github.Abstract_AA.Framestop)
+    if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        print("No display, skipping the time to window benchmark", file=sys.stderr)
+        return
+    command = shlex.split(startup_command) if startup_command else [sys.executable, os.path.join(src_dir, "framestop.py")]
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(command + ["--startup-time"], check=True, capture_output=True, text=True).stdout
+        line = next(line for line in output.splitlines() if "time_to_window_ms" in line)
+        times.append(json.loads(line)["time_to_window_ms"] / 1000)
+    results["startup/time_to_window"] = {
+        "median_s": statistics.median(times), "min_s": min(times), "runs": repeat, "command": " ".join(command),
+    }
+    print(f"{'startup/time_to_window':45s} {results['startup/time_to_window']['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, entry in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        ratio = entry["median_s"] / reference["median_s"]
+        entry["baseline_ratio"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            print(f"REGRESSION {name}: {ratio:.2f}x the baseline", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case (default: 5)")
+    parser.add_argument("--workers", type=int, default=None, help="scoring worker processes (default: CPUs)")
+    parser.add_argument("--only", nargs="+", choices=["rating", "best_frame", "loading", "pixbuf", "startup"],
+                        help="run only these groups")
+    parser.add_argument("--startup-command",
+                        help="command that starts the GUI for the time to window case (default: src/framestop.py)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline (default: 0.2 = 20%%)")
+    parser.add_argument("--save-baseline", help="write the results as a new baseline file")
+    args = parser.parse_args(argv)
+    groups = args.only or ["rating", "best_frame", "loading", "pixbuf", "startup"]
+
+    results = {}
+    try:
+        if "rating" in groups:
+            bench_rating(results, args.repeat)
+        if "best_frame" in groups:
+            bench_best_frame(results, args.repeat, args.workers)
+        if "loading" in groups:
+            with tempfile.TemporaryDirectory() as video_folder:
+                os.environ["XDG_CACHE_HOME"] = video_folder  # Frame stores go with the test videos
+                bench_loading(results, args.repeat, video_folder)
+        if "pixbuf" in groups:
+            bench_pixbuf(results, args.repeat)
+        if "startup" in groups:
+            bench_startup(results, args.repeat, args.startup_command)
+    finally:
+        rating.shutdown_pool()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+
+    report = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+        "regressions": regressions,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+    if not args.output:
+        print(json.dumps(report, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Check that the vectorized delta-E metric still matches the original per-pixel loop.
+
+    python benchmarks/check_delta_e.py
+    python benchmarks/check_delta_e.py --size 200 --threshold 2 5 10
+
+Every image of `imgs_exemplo` is shrunk to the analysis size, as the
+best-frame search does, and scored both by `rating.rate_frames` and by the
+loop Framestop used before scoring was vectorized (one
+`basic_colormath.get_delta_e` call per pixel and neighbour). The script exits
+with status 1 if any score differs by more than `--tolerance` (0.1% by
+default, the agreement documented in `rating.py`).
+"""
+import argparse
+import glob
+import os
+import sys
+
+from basic_colormath import get_delta_e
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+
+import rating  # noqa: E402
+
+
+def neighbour_pixel_values(loaded_img, x, y):
+    return [loaded_img[x, y - 1], loaded_img[x + 1, y], loaded_img[x, y + 1], loaded_img[x - 1, y]]
+
+
+def reference_rating(img, threshold):
+    """The original imageRating: checkerboard pixels against their four neighbours."""
+    largura, altura = img.size
+    loaded_img = img.load()
+    mudancas = 0
+    for linha in range(1, altura - 1):
+        for coluna in range(1, largura - 1):
+            if (linha % 2 == 0 and coluna % 2 == 0) or (linha % 2 == 1 and coluna % 2 == 1):
+                for pixel in neighbour_pixel_values(loaded_img, coluna, linha):
+                    dE = get_delta_e(loaded_img[coluna, linha], pixel)
+                    if dE > threshold:
+                        mudancas += round(dE, 2)
+    return mudancas * 2 / (largura * altura)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100, help="analysis size in pixels (default: 100, as the GUI)")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[5], help="thresholds to check (default: 5)")
+    parser.add_argument("--tolerance", type=float, default=0.001,
+                        help="largest relative difference allowed (default: 0.001)")
+    args = parser.parse_args(argv)
+
+    worst = 0.0
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, "imgs_exemplo", "*.png"))):
+        image = Image.open(path).convert("RGB")
+        image.thumbnail((args.size, args.size))
+        for threshold in args.threshold:
+            expected = reference_rating(image, threshold)
+            actual = float(rating.rate_frames(rating.as_rgb_array(image), threshold))
+            error = abs(actual - expected) / expected if expected else abs(actual)
+            worst = max(worst, error)
+            status = "ok" if error <= args.tolerance else "FAIL"
+            print(f"{os.path.basename(path):15s} t={threshold:<5g} reference {expected:10.4f} "
+                  f"vectorized {actual:10.4f} relative error {error:.2e} {status}")
+    print(f"worst relative error {worst:.2e} (tolerance {args.tolerance:g})")
+    return 0 if worst <= args.tolerance else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""How well each sharpness scorer agrees with delta-E, and what it costs.
+
+    python benchmarks/compare_scorers.py
+    python benchmarks/compare_scorers.py clip.mp4 other.mkv --output scorers.json
+
+Frames are shrunk to the analysis size and scored by every scorer in
+`rating.SCORERS`. Agreement with the delta-E reference is reported as the
+Spearman rank correlation of the scores and as the share of best-frame
+windows where the scorer picks the same frame as delta-E. Cost is the time per
+frame and the speedup over delta-E.
+
+Without videos, test clips are made from `imgs_exemplo`: every image blurred
+at several random strengths, so there is a true sharpest frame to find.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+
+import rating  # noqa: E402
+
+THRESHOLD = 5
+ANALYSIS_SIZE = (100, 100)  # Same as the GUI
+WINDOW = 5
+BLUR_FRAMES = 25
+
+
+def thumbnail(image):
+    copia = image.convert("RGB")
+    copia.thumbnail(ANALYSIS_SIZE)
+    return rating.as_rgb_array(copia)
+
+
+def example_clips():
+    """One clip per example image: the image at BLUR_FRAMES random blur strengths."""
+    rng = np.random.default_rng(0)
+    clips = {}
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, "imgs_exemplo", "*.png"))):
+        image = Image.open(path).convert("RGB")
+        radii = rng.uniform(0, 3, BLUR_FRAMES)
+        clips[os.path.basename(path)] = np.stack([
+            thumbnail(image.filter(ImageFilter.GaussianBlur(float(radius))) if radius > 0.1 else image)
+            for radius in radii
+        ])
+    return clips
+
+
+def video_clip(path, max_frames):
+    from frames import VideoFrameSource
+    source = VideoFrameSource(path)
+    try:
+        step = max(1, source.frame_count // max_frames)
+        return np.stack([thumbnail(source.get_image(index)) for index in range(0, source.frame_count, step)])
+    finally:
+        source.close()
+
+
+def ranks(values):
+    order = np.argsort(values, kind="stable")
+    result = np.empty(len(values))
+    result[order] = np.arange(len(values))
+    return result
+
+
+def spearman(a, b):
+    ra, rb = ranks(a), ranks(b)
+    if ra.std() == 0 or rb.std() == 0:
+        return 1.0 if np.array_equal(ra, rb) else 0.0
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def window_agreement(reference, scores):
+    """Share of WINDOW-frame windows where both score arrays pick the same best frame."""
+    starts = range(0, max(1, len(scores) - WINDOW + 1))
+    same = [np.argmax(reference[s:s + WINDOW]) == np.argmax(scores[s:s + WINDOW]) for s in starts]
+    return float(np.mean(same))
+
+
+def time_scorer(scorer, frames, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scorer.rate(frames, THRESHOLD)
+        times.append(time.perf_counter() - start)
+    return min(times) / len(frames)
+
+
+def compare(clips, repeat):
+    reference = rating.get_scorer(rating.DEFAULT_SCORER)
+    report = {}
+    for scorer in rating.SCORERS.values():
+        correlations, agreements, per_frame = [], [], []
+        for frames in clips.values():
+            reference_scores = np.atleast_1d(reference.rate(frames, THRESHOLD))
+            scores = np.atleast_1d(scorer.rate(frames, THRESHOLD))
+            correlations.append(spearman(reference_scores, scores))
+            agreements.append(window_agreement(reference_scores, scores))
+            per_frame.append(time_scorer(scorer, frames, repeat))
+        report[scorer.name] = {
+            "label": scorer.label,
+            "spearman": float(np.mean(correlations)),
+            "window_agreement": float(np.mean(agreements)),
+            "ms_per_frame": float(np.mean(per_frame)) * 1000,
+        }
+    reference_cost = report[reference.name]["ms_per_frame"]
+    for entry in report.values():
+        entry["speedup"] = reference_cost / entry["ms_per_frame"]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="*", help="sample videos (default: clips made from imgs_exemplo)")
+    parser.add_argument("--max-frames", type=int, default=200, help="frames sampled per video (default: 200)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per clip (default: 3)")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    clips = {os.path.basename(path): video_clip(path, args.max_frames) for path in args.videos} or example_clips()
+    report = compare(clips, args.repeat)
+
+    print(f"{'scorer':15s} {'spearman':>9s} {'windows':>8s} {'ms/frame':>9s} {'speedup':>8s}", file=sys.stderr)
+    for name, entry in report.items():
+        print(f"{name:15s} {entry['spearman']:9.3f} {entry['window_agreement']:8.0%} "
+              f"{entry['ms_per_frame']:9.3f} {entry['speedup']:7.1f}x", file=sys.stderr)
+    result = {"clips": sorted(clips), "threshold": THRESHOLD, "window": WINDOW, "scorers": report}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Headless best-frame extraction, no GTK required.
+
+Runs the same best-frame search as the GUI's "Apply Optimization" on one or
+more videos, writes the chosen frames to an output folder and prints a JSON
+summary:
+
+    framestop-batch clip.mp4 other.mkv --frames 120 480 --times 00:01:05 12.5 -o stills/
+    framestop-batch clips/*.mp4 --segments 12 -o contact_sheets/
+
+With --segments or --every, the whole video is split into segments and the
+best frame of each is extracted, in a single pass over the video.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+
+from PIL import Image
+
+import bulk
+import rating
+import scenes
+import timing
+from dedup import FrameDeduplicator
+from export import ExportQueue, save_frame, settings_for_extension
+from frames import VideoFrameSource
+from sharpness import SharpnessIndex, build_index
+
+ANALYSIS_SIZE = (100, 100)  # Same as the GUI
+
+
+def parse_timestamp(value):
+    """Parse seconds ("12.5") or a clock time ("1:05", "00:01:05.5") into seconds."""
+    seconds = 0.0
+    for part in value.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def requested_frames(frame_source, frames, times):
+    """Frame indices asked for on the command line, in order, within the video."""
+    indices = list(frames)
+    # Same rounding as moviepy uses to map a time to a frame
+    indices += [int(frame_source.fps * t + 0.00001) for t in times]
+    return [min(max(index, 0), frame_source.frame_count - 1) for index in indices]
+
+
+def save_output(frame, args, stem, index):
+    """Write frame `index` to the output folder and return its path."""
+    export_settings = settings_for_extension(args.format, args.quality, args.compression)
+    if export_settings is not None:
+        return save_frame(frame, args.output, f"{stem}_frame_{index}", export_settings)
+    output = os.path.join(args.output, f"{stem}_frame_{index}.{args.format}")
+    Image.fromarray(frame).save(output)
+    return output
+
+
+def extract_segments(frame_source, stem, sharpness_index, scene_index, args):
+    """Best frame of every segment, found in one pass and written while the pass goes on."""
+    segments = bulk.split_segments(frame_source.frame_count, frame_source.fps, args.segments, args.every)
+    export_queue = ExportQueue()
+    saved = {}
+
+    def on_winner(segment_number, index, score, frame):
+        saved[segment_number] = export_queue.submit(lambda: save_output(frame, args, stem, index))
+
+    try:
+        winners = bulk.best_frames(
+            frame_source, segments, args.threshold, ANALYSIS_SIZE, args.workers, sharpness_index, on_winner,
+            scene_index=scene_index, scorer=args.scorer,
+        )
+        concurrent.futures.wait(saved.values())
+    finally:
+        export_queue.shutdown()
+    frames = []
+    for segment_number, ((start, end), (best, score)) in enumerate(zip(segments, winners)):
+        frames.append({
+            "segment": [start, end],
+            "best": best,
+            "time": best / frame_source.fps,
+            "score": score,
+            "output": saved[segment_number].result(),
+        })
+    return frames
+
+
+def process_video(path, args, score_cache=None):
+    """Extract the best frame around every requested position of one video.
+
+    `score_cache` (a `rating.ScoreCache` for this video) keeps the scores for
+    later calls, e.g. the next job on the same clip in the job server. Errors
+    are reported in `result["error"]` instead of being raised.
+    """
+    result = {"video": path, "frames": []}
+    try:
+        frame_source = VideoFrameSource(path, dedup=FrameDeduplicator(args.dedup or None) if args.dedup is not None else None)
+    except Exception as e:
+        result["error"] = f"Invalid video file: {e}"
+        return result
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    result["fps"] = frame_source.fps
+    result["frame_count"] = frame_source.frame_count
+    try:
+        sharpness_index = None
+        if args.index:
+            sharpness_index = SharpnessIndex.load(path, args.threshold, ANALYSIS_SIZE, scorer=args.scorer)
+            if sharpness_index is None:
+                sharpness_index = build_index(
+                    frame_source, args.threshold, ANALYSIS_SIZE, args.workers, scorer=args.scorer
+                )
+                sharpness_index.save(path)
+        scene_index = scenes.load_or_detect(path) if args.scenes else None
+        if scene_index is not None:
+            result["cuts"] = scene_index.cuts.tolist()
+        if args.segments or args.every:
+            result["frames"] = extract_segments(frame_source, stem, sharpness_index, scene_index, args)
+            return result
+        if score_cache is None:
+            score_cache = rating.ScoreCache()  # Nearby requested frames share most of their windows
+        for requested in requested_frames(frame_source, args.frames, args.times):
+            best, score = requested, None
+            if args.window > 1:
+                best, score = rating.find_best_frame(
+                    frame_source, requested, args.window, args.threshold, args.workers,
+                    ANALYSIS_SIZE, sharpness_index, scene_index, args.scorer, score_cache
+                )
+            output = save_output(frame_source.get_frame(best), args, stem, best)
+            result["frames"].append({
+                "requested": requested,
+                "best": best,
+                "time": best / frame_source.fps,
+                "score": score,
+                "output": output,
+            })
+    except Exception as e:
+        # One bad clip must not end an unattended run: record it and go on with the next video
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        frame_source.close()
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="framestop-batch",
+        description="Extract the sharpest frame around given positions of one or more videos.",
+    )
+    parser.add_argument("videos", nargs="+", help="video files to process")
+    parser.add_argument("-f", "--frames", nargs="+", type=int, default=[], metavar="INDEX",
+                        help="frame indices to extract")
+    parser.add_argument("-t", "--times", nargs="+", type=parse_timestamp, default=[], metavar="TIME",
+                        help="timestamps to extract, in seconds or [HH:]MM:SS[.ms]")
+    parser.add_argument("-n", "--segments", type=int, metavar="N",
+                        help="split the video into N segments and extract the best frame of each")
+    parser.add_argument("-e", "--every", type=float, metavar="SECONDS",
+                        help="extract the best frame of every SECONDS long segment")
+    parser.add_argument("-o", "--output", default=".", help="output folder (default: current folder)")
+    parser.add_argument("-w", "--window", type=int, default=5,
+                        help="frame range for analysis, 1 disables the search (default: 5)")
+    parser.add_argument("--threshold", type=float, default=5, help="frame selection threshold (default: 5)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for scoring (default: number of CPUs)")
+    parser.add_argument("--scorer", choices=sorted(rating.SCORERS), default=rating.DEFAULT_SCORER,
+                        help=f"sharpness metric (default: {rating.DEFAULT_SCORER})")
+    parser.add_argument("--format", default="jpg", help="image format of the saved frames (default: jpg)")
+    parser.add_argument("--quality", type=int, default=75,
+                        help="JPEG/WebP quality, 1-100 (default: 75)")
+    parser.add_argument("--compression", type=int, default=6,
+                        help="PNG compression level / WebP effort, 0-9 (default: 6)")
+    parser.add_argument("--index", action="store_true",
+                        help="score every frame once and reuse the scores saved next to the video")
+    parser.add_argument("--scenes", action="store_true",
+                        help="detect scene cuts (saved next to the video) and keep every search within one shot")
+    parser.add_argument("--dedup", type=int, nargs="?", const=0, metavar="BITS",
+                        help="score repeated frames once; BITS also merges neighbours within that many dHash bits "
+                             "and with the same amount of detail, so blurrier frames are not merged into sharp ones")
+    parser.add_argument("--timings", metavar="FILE",
+                        help="record how long each stage takes and write the timings to this JSON file")
+    parser.add_argument("--summary", help="also write the JSON summary to this file")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if (args.segments or args.every) and (args.frames or args.times):
+        parser.error("--segments/--every cannot be combined with --frames/--times")
+    if not args.frames and not args.times and not args.segments and not args.every:
+        args.frames = [0]
+    os.makedirs(args.output, exist_ok=True)
+    timing.enable(bool(args.timings))
+
+    try:
+        results = [process_video(path, args) for path in args.videos]
+    finally:
+        rating.shutdown_pool()
+
+    if args.timings:
+        timing.export_json(args.timings, videos=args.videos, scorer=args.scorer)
+    summary = json.dumps({"results": results}, indent=2)
+    print(summary)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            f.write(summary)
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Best frame of every segment of a video, found in a single forward pass.
+
+The video is split into segments (a fixed number, or one every few seconds)
+and every frame is decoded once, in order, scored like `rating.find_best_frame`
+does and compared with the best frame of its segment so far. Only the current
+winner and one scoring batch are held in memory at full resolution, and each
+winner is handed over as soon as its segment ends, so it can be written while
+the pass goes on.
+"""
+import numpy as np
+from PIL import Image
+
+import rating
+import timing
+
+_BATCH_FRAMES = 16  # Full resolution frames held while a batch is scored
+
+
+def split_segments(frame_count, fps, count=None, interval=None):
+    """[start, end) frame ranges covering the whole video.
+
+    Either `count` segments of (nearly) equal length, or one segment every
+    `interval` seconds (the last one may be shorter).
+    """
+    if interval is not None:
+        step = max(1, round(interval * fps))
+        bounds = list(range(0, frame_count, step)) + [frame_count]
+    else:
+        count = max(1, min(count, frame_count))
+        bounds = [round(i * frame_count / count) for i in range(count + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def clip_to_shots(segments, scene_index):
+    """Clip every segment to the shot of its middle frame, so no winner comes from a shot just touching it."""
+    clipped = []
+    for start, end in segments:
+        shot_start, shot_end = scene_index.shot_bounds((start + end - 1) // 2)
+        clipped.append((max(start, shot_start), min(end, shot_end)))
+    return clipped
+
+
+def best_frames(frame_source, segments, threshold, analysis_size=(100, 100), workers=None,
+                sharpness_index=None, on_winner=None, progress=None, should_stop=None, scene_index=None,
+                scorer=rating.DEFAULT_SCORER):
+    """Return [(index, score)] of the best frame of every segment, or None if stopped.
+
+    `on_winner(segment_number, index, score, frame)` receives each winner and its
+    full resolution frame as soon as its segment is done. `progress(done, total)`
+    is called as frames are scored; `should_stop()` is checked between frames.
+    With a matching `sharpness.SharpnessIndex` nothing is scored and only the
+    winners are decoded, in forward order. With a `scenes.SceneIndex`, segments
+    are clipped to one shot each (see `clip_to_shots`) and frames outside are
+    not scored. Repeats of a frame already seen in the segment (see
+    `frames.VideoFrameSource.representative`) are not scored either: they can
+    only tie with it, and ties go to the earlier frame.
+    """
+    if scene_index is not None:
+        segments = clip_to_shots(segments, scene_index)
+    if sharpness_index is not None and sharpness_index.matches(threshold, analysis_size, scorer):
+        return _best_frames_from_index(frame_source, segments, sharpness_index, on_winner, progress, should_stop)
+
+    total = sum(end - start for start, end in segments)
+    done = 0
+    winners = []
+    for segment_number, (start, end) in enumerate(segments):
+        best = None  # (index, score, frame)
+        batch = []
+        seen = set()
+        for frame_index in range(start, end):
+            if should_stop is not None and should_stop():
+                return None
+            frame = frame_source.get_frame(frame_index)
+            key = frame_source.representative(frame_index)
+            if key in seen:
+                done += 1
+            else:
+                seen.add(key)
+                with timing.stage("fromarray"):
+                    copia = Image.fromarray(frame)
+                with timing.stage("thumbnail"):
+                    copia.thumbnail(analysis_size)
+                batch.append((frame_index, frame, rating.as_rgb_array(copia)))
+            if len(batch) == _BATCH_FRAMES or (batch and frame_index == end - 1):
+                scores = np.atleast_1d(rating.rate_frames_parallel(np.stack([b[2] for b in batch]), threshold, workers, scorer))
+                top = int(np.argmax(scores))  # First of equal scores, like find_best_frame
+                if best is None or scores[top] > best[1]:
+                    best = (batch[top][0], float(scores[top]), batch[top][1])
+                done += len(batch)
+                batch = []
+                if progress is not None:
+                    progress(done, total)
+        winners.append(best[:2])
+        if on_winner is not None:
+            on_winner(segment_number, *best)
+    return winners
+
+
+def _best_frames_from_index(frame_source, segments, sharpness_index, on_winner, progress, should_stop):
+    winners = [sharpness_index.best_in(list(range(start, end))) for start, end in segments]
+    for segment_number, (frame_index, score) in enumerate(winners):
+        if should_stop is not None and should_stop():
+            return None
+        if on_winner is not None:
+            on_winner(segment_number, frame_index, score, frame_source.get_frame(frame_index))
+        if progress is not None:
+            progress(segment_number + 1, len(winners))
+    return winners
@@ -0,0 +1,84 @@
+"""Detection of repeated frames, so each distinct picture is cached and scored once.
+
+GIFs, screen recordings and animation exports often repeat a frame for many
+frame periods. Every decoded frame is fingerprinted with a SHA-1 of its
+pixels (hardware accelerated on most CPUs, a few ms for a 1080p frame) and
+mapped to the first frame with the same fingerprint: its representative.
+Optionally, a frame whose 64-bit difference hash is within `tolerance` bits
+of the previous frame's representative is also merged into it. Near
+duplicates are only looked for between neighbouring frames, so slow fades do
+not drift into one frame. dHash does not see blur (a sharp frame and a
+blurred copy of it usually hash the same), so frames are only merged if their
+detail, the mean gradient of the full-resolution frame, is also within
+DETAIL_TOLERANCE: a sharp frame is never hidden behind a blurry neighbour.
+"""
+import hashlib
+import threading
+
+import numpy as np
+from PIL import Image
+
+DETAIL_TOLERANCE = 0.02  # Largest relative difference of detail between merged near duplicates
+
+
+def difference_hash(frame):
+    """64-bit dHash: signs of the horizontal gradients of a 9x8 grayscale thumbnail."""
+    small = np.asarray(Image.fromarray(frame).convert("L").resize((9, 8), Image.BOX), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def detail(frame):
+    """Mean absolute horizontal and vertical gradient of the green channel, which drops with blur."""
+    green = np.asarray(frame[..., 1], dtype=np.int16)
+    return float(np.abs(np.diff(green, axis=0)).mean() + np.abs(np.diff(green, axis=1)).mean())
+
+
+class FrameDeduplicator:
+    """Maps frame indices to the index of the first identical (or, with `tolerance`, similar) frame.
+
+    `tolerance` is the number of dHash bits two neighbouring frames may differ
+    by and still be merged, provided their detail differs by at most
+    DETAIL_TOLERANCE; None merges identical frames only.
+    """
+
+    def __init__(self, tolerance=None):
+        self.tolerance = tolerance
+        self._by_digest = {}
+        self._representative = {}
+        self._rep_hash = {}  # Index -> (dHash, detail) of its representative, for the next frame's comparison
+        self._lock = threading.Lock()
+
+    def add(self, index, frame):
+        """Fingerprint decoded frame `index` and return its representative."""
+        with self._lock:
+            known = self._representative.get(index)
+        if known is not None:
+            return known
+        digest = hashlib.sha1(np.ascontiguousarray(frame).data).digest()
+        frame_hash = (difference_hash(frame), detail(frame)) if self.tolerance is not None else None
+        with self._lock:
+            representative = self._by_digest.setdefault(digest, index)
+            if representative == index and frame_hash is not None:
+                previous = self._rep_hash.get(index - 1)
+                if previous is not None and self._similar(previous, frame_hash):
+                    representative = self._representative[index - 1]
+                    self._by_digest[digest] = representative
+            self._representative[index] = representative
+            if frame_hash is not None:
+                self._rep_hash[index] = self._rep_hash.get(representative, frame_hash)
+        return representative
+
+    def _similar(self, a, b):
+        (hash_a, detail_a), (hash_b, detail_b) = a, b
+        if bin(hash_a ^ hash_b).count("1") > self.tolerance:
+            return False
+        return abs(detail_a - detail_b) <= DETAIL_TOLERANCE * max(detail_a, detail_b)
+
+    def representative(self, index):
+        """Representative of `index` if it was decoded already, else `index` itself."""
+        return self._representative.get(index, index)
+
+    def stats(self):
+        with self._lock:
+            return {"frames": len(self._representative), "unique": len(set(self._representative.values()))}
@@ -0,0 +1,103 @@
+"""Saving frames to image files, in the background.
+
+Exports run on a small pool of writer threads (Pillow releases the GIL while
+encoding), with a bounded number of queued jobs, so encoding and best-frame
+searches never run in a GTK handler.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import timing
+
+# Format name -> (Pillow format, file extension)
+FORMATS = {
+    "JPEG": ("JPEG", "jpg"),
+    "PNG": ("PNG", "png"),
+    "WebP": ("WEBP", "webp"),
+}
+
+
+class ExportSettings:
+    """Output format and encoder settings.
+
+    `quality` (1-100) applies to JPEG and lossy WebP. `compression` (0-9) is
+    the PNG compression level; for WebP it is mapped to the encoder effort
+    (method 0-6).
+    """
+
+    def __init__(self, format="JPEG", quality=75, compression=6):
+        self.format = format
+        self.quality = quality
+        self.compression = compression
+
+    @property
+    def extension(self):
+        return FORMATS[self.format][1]
+
+    def save_options(self):
+        pil_format = FORMATS[self.format][0]
+        if pil_format == "JPEG":
+            return {"format": pil_format, "quality": self.quality}
+        if pil_format == "PNG":
+            return {"format": pil_format, "compress_level": self.compression}
+        return {"format": pil_format, "quality": self.quality, "method": round(self.compression * 6 / 9)}
+
+
+def settings_for_extension(extension, quality=75, compression=6):
+    """ExportSettings for a file extension ("jpg", "png", "webp"), or None if it is not one of FORMATS."""
+    for name, (_, format_extension) in FORMATS.items():
+        if extension.lower().lstrip(".") in (format_extension, name.lower()):
+            return ExportSettings(name, quality, compression)
+    return None
+
+
+def save_frame(frame, folder, name, settings):
+    """Save an RGB frame (array or PIL image) as `<folder>/<name>.<ext>` and return the path."""
+    if isinstance(frame, Image.Image):
+        image = frame
+    else:
+        with timing.stage("fromarray"):
+            image = Image.fromarray(frame)
+    path = os.path.join(folder, f"{name}.{settings.extension}")
+    with timing.stage(f"encode_{settings.format.lower()}"):
+        image.save(path, **settings.save_options())
+    return path
+
+
+class ExportQueue:
+    """Runs export jobs on `workers` threads with at most `max_pending` jobs waiting.
+
+    When the queue is full, `submit` waits for a free slot, or returns None
+    right away with `block=False`. `on_done(result, error)` is
+    called from the worker thread when a job finishes; GUI callers should hop
+    back to the main loop (GLib.idle_add) from there.
+    """
+
+    def __init__(self, workers=2, max_pending=8):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, job, on_done=None, block=True):
+        if not self._slots.acquire(blocking=block):
+            return None
+        with self._lock:
+            self.pending += 1
+        future = self._executor.submit(job)
+        future.add_done_callback(lambda f: self._finished(f, on_done))
+        return future
+
+    def _finished(self, future, on_done):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+        if on_done is not None and not future.cancelled():
+            error = future.exception()
+            on_done(None if error else future.result(), error)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
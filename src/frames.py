@@ -0,0 +1,179 @@
+"""On-demand access to the frames of a video file.
+
+Only the container metadata (frame count, fps, size) is read when a video is
+opened; frames are decoded by index when something asks for them. Memory use
+therefore does not depend on the length of the video.
+"""
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+import timing
+
+
+def warm_up():
+    """Import the moviepy reader ahead of the first video, e.g. from a background thread at startup."""
+    # moviepy.editor would also pull in audio, previews and ImageMagick lookups; the reader is all we need
+    from moviepy.video.io.VideoFileClip import VideoFileClip  # noqa: F401
+
+
+class FrameCache:
+    """LRU cache keyed by frame index, bounded by a byte budget.
+
+    `sizeof` returns the size of a cached value in bytes; the default works for
+    numpy arrays. Hits and misses are counted so the budget can be tuned.
+    """
+
+    def __init__(self, max_bytes, sizeof=lambda value: value.nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, index):
+        return index in self._entries
+
+    def get(self, index):
+        with self._lock:
+            entry = self._entries.get(index)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(index)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, index, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if index in self._entries:
+                self.current_bytes -= self._entries.pop(index)[1]
+            if size > self.max_bytes:
+                return  # Would evict everything else and still not fit
+            self._entries[index] = (value, size)
+            self.current_bytes += size
+            self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+
+
+def fit_within(size, max_size):
+    """Largest (width, height) with the aspect ratio of `size` that fits in `max_size`, or None if it already fits."""
+    width, height = size
+    ratio = min(max_size[0] / width, max_size[1] / height)
+    if ratio >= 1:
+        return None
+    return max(2, round(width * ratio)), max(2, round(height * ratio))
+
+
+class VideoFrameSource:
+    """Random access to the frames of a video, decoded through ffmpeg on demand.
+
+    moviepy's reader keeps a single ffmpeg pipe open: reading forward (or
+    re-reading the same frame) is cheap, jumping backwards or far ahead
+    restarts the pipe with a seek. Access is serialized with a lock because the
+    GUI and worker threads share one reader.
+
+    Decoded frames are kept in `cache` (a `FrameCache`) when one is given.
+
+    With `max_size` (width, height), larger videos are decoded as a reduced
+    resolution proxy: ffmpeg scales every frame to fit, which makes decoding
+    and caching much cheaper. `width`/`height` are the size of the frames
+    returned, `source_width`/`source_height` the size of the video itself.
+
+    With `dedup` (a `dedup.FrameDeduplicator`), repeated frames are cached once,
+    under the index of their representative (see `representative`).
+    """
+
+    def __init__(self, path, cache=None, max_size=None, dedup=None):
+        # Imported on first use: moviepy takes longer to import than the window takes to appear
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+        self.path = path
+        self.cache = cache
+        self.dedup = dedup
+        target_resolution = None
+        if max_size is not None:
+            proxy_size = fit_within(ffmpeg_parse_infos(path)["video_size"], max_size)
+            if proxy_size is not None:
+                target_resolution = proxy_size[1], proxy_size[0]  # moviepy wants (height, width)
+        self.clip = VideoFileClip(path, audio=False, target_resolution=target_resolution)
+        self.fps = self.clip.fps
+        self.width, self.height = self.clip.size
+        self.source_width, self.source_height = self.clip.reader.infos["video_size"]
+        self.is_proxy = (self.width, self.height) != (self.source_width, self.source_height)
+        # Same count as VideoFileClip.iter_frames() yields (t = 0, 1/fps, ... < duration)
+        self.frame_count = max(1, math.ceil(round(self.clip.duration * self.fps, 6)))
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.frame_count
+
+    def get_frame(self, index):
+        """Return frame `index` as an (H, W, 3) uint8 array."""
+        if not 0 <= index < self.frame_count:
+            raise IndexError(f"Frame {index} out of range (0-{self.frame_count - 1})")
+        if self.cache is not None:
+            frame = self.cache.get(self.representative(index))
+            if frame is not None:
+                return frame
+        with self._lock, timing.stage("decode"):
+            if self.closed:
+                raise ValueError(f"{self.path} was closed")
+            frame = self.clip.get_frame(index / self.fps)
+        key = index
+        if self.dedup is not None:
+            with timing.stage("dedup"):
+                key = self.dedup.add(index, frame)
+        if self.cache is not None and (key == index or key not in self.cache):
+            self.cache.put(key, frame)
+        return frame
+
+    def representative(self, index):
+        """Index of the first frame known to show the same picture as `index` (itself if none)."""
+        return self.dedup.representative(index) if self.dedup is not None else index
+
+    def get_image(self, index):
+        """Return frame `index` as a PIL image."""
+        frame = self.get_frame(index)
+        with timing.stage("fromarray"):
+            return Image.fromarray(frame)
+
+    def close(self):
+        # The cache may be shared with other readers of the same video, its owner clears it
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self.clip.close()
@@ -1,21 +1,64 @@
 #!/usr/bin/env python3
+import os
+import time
+
+
+def process_started():
+    # perf_counter() value when this process started, from the kernel's start time of the process
+    # (Linux); elsewhere the time this module started loading, before anything heavy is imported
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])  # Field 22, starttime
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.perf_counter() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter()
+
+
+STARTED = process_started()  # Reference for --startup-time
+
 import gi
 gi.require_version('Rsvg', '2.0')
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, GObject, GdkPixbuf, GLib, Gdk, Rsvg
-from moviepy.editor import VideoFileClip
-import os
-import time
+import concurrent.futures
+import copy
+import sys
 import threading
+import numpy as np
 from PIL import Image
-from basic_colormath import get_delta_e
+import bulk
+import rating
+import timing
+import frames
+from frames import FrameCache, VideoFrameSource
+from loader import LoadJob
+from prefetch import Prefetcher
+from frameview import FrameView
+import framestore
+from export import FORMATS, ExportQueue, ExportSettings, save_frame
+from scenes import load_or_detect
+from sharpness import SharpnessIndex, build_index
 
 if not hasattr(Image, 'ANTIALIAS'):
     Image.ANTIALIAS = Image.Resampling.LANCZOS  # Ensure compatibility with Pillow 10.x
 
-if not Gtk.init_check():
-    print("Failed to initialize GTK.")
-    exit(1)
+def pixbuf_from_frame(frame):
+    # Straight from the decoded RGB array, copied twice: tobytes(), then into GLib.Bytes.
+    # Zero-copy is not reachable through PyGObject: GLib.Bytes.new always copies its argument and
+    # reads any buffer other than real bytes item by item (a 3-D memoryview raises). The PIL image +
+    # tobytes() + new_from_data path copied every frame three times.
+    with timing.stage("pixbuf"):
+        frame = np.ascontiguousarray(frame)
+        height, width = frame.shape[:2]
+        return GdkPixbuf.Pixbuf.new_from_bytes(
+            GLib.Bytes.new(frame.tobytes()),
+            GdkPixbuf.Colorspace.RGB,
+            False, 8,
+            width, height,
+            width * 3
+        )
 
 class framestop(Gtk.Window):
 
@@ -28,6 +71,19 @@ class framestop(Gtk.Window):
         self.frame_analysis_value = 5
         self.threshold = 5
         self.scale_factor = 1.0
+        self.cache_size_mb = 512  # Memory ceiling for cached frames, split between decoded frames and pixbufs
+        self.analysis_workers = os.cpu_count() or 1  # Processes used to score frames in getBestFrame
+        self.analysis_size = (100, 100)  # Frames are shrunk to fit this size before scoring
+        self.build_sharpness_index = False  # Score the whole video in the background and keep a sidecar file
+        self.proxy_preview = True  # Browse and score a screen-sized proxy, decode full resolution only for export
+        self.scorer = rating.DEFAULT_SCORER  # Sharpness metric, see rating.SCORERS
+        self.frame_store_gb = 0  # Keep decoded preview frames on disk for instant re-open, 0 disables
+        self.record_timings = False  # Time decode, scoring, display and export stages (Diagnostics)
+        self.dedup_tolerance = 0  # Merge repeated frames: -1 off, 0 identical only, N = dHash bits of difference allowed
+        self.prefetch_depth = 4  # Frames prepared ahead in the direction of navigation, 0 disables
+        self.use_scene_cuts = False  # Detect scene cuts in the background and keep best-frame searches within one shot
+        self.export_settings = ExportSettings()  # Screenshot format, quality and compression level
+        self.export_queue = ExportQueue(workers=2, max_pending=8)  # Screenshots are searched and encoded in the background
 
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
         self.add(vbox)
@@ -62,8 +118,16 @@ class framestop(Gtk.Window):
 
         self.frame_area = Gtk.ScrolledWindow(hexpand=True, vexpand=True)
         self.frame_area.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        self.frame_area.connect("size-allocate", self.on_window_resize)
         grid.attach(self.frame_area, 0, 2, 3, 1)
 
+        # Paints only the visible part of the frame at the current zoom level
+        self.frame_view = FrameView()
+        self.frame_view.connect("roi-changed", self.on_roi_changed)  # Drag over the frame to score only that region
+        self.frame_area.add(self.frame_view)
+        self.display_update_id = None  # Pending idle callback of schedule_display
+        self.frame_area_size = None
+
         # Adjustment for the slider
         adjustment = Gtk.Adjustment(value=0, lower=0, upper=0, step_increment=1, page_increment=1)
         self.frame_slider = Gtk.Scale(orientation=Gtk.Orientation.HORIZONTAL, adjustment=adjustment)
@@ -122,6 +186,11 @@ class framestop(Gtk.Window):
         settings_button.connect("clicked", self.on_open_settings)
         hbox_controls.pack_start(settings_button, False, False, 0)
 
+        # Diagnostics button
+        diagnostics_button = Gtk.Button(label="Diagnostics")
+        diagnostics_button.connect("clicked", self.on_open_diagnostics)
+        hbox_controls.pack_start(diagnostics_button, False, False, 0)
+
         # About button 
         about_button = Gtk.Button(label="About")
         about_button.connect("clicked", self.on_about_button_clicked)
@@ -146,12 +215,35 @@ class framestop(Gtk.Window):
         copytoclip_button.connect("clicked", self.copytoclip)
         hbox_controls2.pack_start(copytoclip_button, True, True, 0)                                                     
 
+        # Bulk export: best frame of every segment of the video
+        self.extract_button = Gtk.Button(label="Extract best frames...")
+        self.extract_button.connect("clicked", self.on_extract_best_frames)
+        hbox_controls2.pack_start(self.extract_button, True, True, 0)
+
         grid.attach(hbox_controls2, 0, 6, 3, 1)
 
-        self.frame_images = []
+        # Progress of the bulk export, hidden while none is running
+        self.extract_progress = Gtk.ProgressBar()
+        self.extract_progress.set_show_text(True)
+        self.extract_progress.set_no_show_all(True)
+        grid.attach(self.extract_progress, 0, 7, 3, 1)
+        self.extract_stop = None  # threading.Event of the running bulk export
+
+        self.frame_source = None
         self.current_frame = 0
-        self.video = None
-        self.pixbuf_cache = []
+        # Two tiers keyed by frame index: decoded RGB frames and ready-to-display pixbufs
+        self.frame_cache = FrameCache(self.cache_size_mb * 1024 * 1024 // 2)  # Replaced by the cache of each load job
+        self.pixbuf_cache = FrameCache(self.cache_size_mb * 1024 * 1024 // 2, sizeof=lambda pixbuf: pixbuf.get_byte_length())
+        self.sharpness_index = None
+        self.scene_index = None
+        self.scene_stop = None  # threading.Event of the running scene-cut detection
+        self.index_stop = None  # threading.Event of the running sharpness index pass
+        self.load_job = None  # loader.LoadJob of the current video, its results are ignored once replaced
+        self.preview_max_size = None  # Proxy size of the loaded video, None for full resolution
+        self.export_source = None  # Full resolution reader, opened on the first export
+        self.export_source_lock = threading.Lock()  # Export threads open and use it, the main thread closes it
+        self.score_cache = rating.ScoreCache()  # Scores of the current video, reused by overlapping best-frame searches
+        self.prefetcher = Prefetcher(self.prefetch_frame, self.prefetch_depth)
         self.loading_animation_id = None
 
         # Add loading label (for the "Loading frames..." message)
@@ -163,15 +255,36 @@ class framestop(Gtk.Window):
     def update_status(self, message):
         GLib.idle_add(self.status_label.set_text, message)
 
+    def update_job_status(self, job, message):
+        # Status from a loader thread, dropped if the user moved on to another video meanwhile
+        GLib.idle_add(self.on_job_status, job, message)
+
+    def on_job_status(self, job, message):
+        if job is self.load_job:
+            self.status_label.set_text(message)
+
     def clearall(self,widget):  # This is meant to essentially bring the program back to its base state
-        self.frame_images = []
+        if self.extract_stop is not None:
+            self.extract_stop.set()
+        if self.load_job is not None:
+            self.load_job.cancel()  # Stops its decoders right away
+            self.load_job = None
+        if self.frame_source is not None:
+            self.frame_source.close()
+        self.frame_source = None
+        self.close_export_source()
+        self.stop_sharpness_index()
+        self.sharpness_index = None
+        self.stop_scene_index()
+        self.scene_index = None
         self.current_frame = 0
-        self.video = None
-        self.pixbuf_cache = []
+        self.prefetcher.cancel()
+        self.frame_cache.clear()
+        self.pixbuf_cache.clear()
+        self.score_cache = rating.ScoreCache()  # Replaced, not cleared: queued searches still hold the old one
         self.input_entry.set_text("")
         self.output_entry.set_text("")
-        for child in self.frame_area.get_children():
-            self.frame_area.remove(child)
+        self.frame_view.clear()
         self.frame_slider.set_value(0)
         adjustment = self.frame_slider.get_adjustment()
         adjustment.set_lower(0)
@@ -180,33 +293,51 @@ class framestop(Gtk.Window):
         self.stop_loading_animation()
 
     def copytoclip(self,widget):
-        if not self.frame_images:
+        if self.frame_source is None:
             self.show_error_dialog("Error: No frame to copy. Load a video first.")
             self.stop_loading_animation()
             return
 
-        # Get the current frame image (PIL.Image object)
-        selected_frame = self.frame_images[self.current_frame]
-        if self.optimize_checkbox.get_active():
-            selected_frame, self.current_frame = self.getBestFrame()
+        frame_index = self.current_frame
+        optimize = self.optimize_checkbox.get_active()
+        # Taken now: the job may run after the user moved on, cleared the inputs or opened another video
+        frame_source, job = self.frame_source, self.load_job
+        search = self.search_settings() if optimize else None
 
-        # Convert the PIL Image to a GdkPixbuf object
-        buffer = selected_frame.tobytes()
-        pixbuf = GdkPixbuf.Pixbuf.new_from_data(
-            buffer,
-            GdkPixbuf.Colorspace.RGB,
-            False, 8,
-            selected_frame.width, selected_frame.height,
-            selected_frame.width * 3
+        def find_frame():
+            # Get the frame (RGB array straight from the decoder), searching in the background
+            with timing.stage("copytoclip"):
+                best_index = self.getBestFrame(frame_source, frame_index, search) if optimize else frame_index
+                return [self.get_export_source(frame_source, job).get_frame(best_index), best_index]
+
+        if optimize:
+            self.update_status("Searching for the best frames...")
+        future = self.export_queue.submit(
+            find_frame, lambda result, error: GLib.idle_add(self.on_copy_frame_found, job, frame_index, result, error), block=False
         )
+        if future is None:
+            self.update_status("Too many exports in progress, try again in a moment.")
+
+    def on_copy_frame_found(self, job, old_frame, result, error):
+        if job is not self.load_job:  # Another file was selected or the inputs were cleared meanwhile
+            return
+        if error is not None:
+            self.status_label.set_text(f"Error copying frame: {error}")
+            return
+        selected_frame, frame_index = result
+        self.move_to_found_frame(old_frame, frame_index)
+
+        # Convert the frame to a GdkPixbuf object
+        pixbuf = pixbuf_from_frame(selected_frame)
 
         # Get the clipboard object and set the Pixbuf
-        clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
-        clipboard.set_image(pixbuf)
+        with timing.stage("clipboard"):
+            clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+            clipboard.set_image(pixbuf)
 
         # Update the status to inform the user
-        self.update_status(f"Copied frame {self.current_frame} to clipboard.")
-        print(f"Copied frame {self.current_frame} to clipboard.")
+        self.status_label.set_text(f"Copied frame {frame_index} to clipboard.")
+        print(f"Copied frame {frame_index} to clipboard.")
 
     def on_frame_skip_value_changed(self, widget):
         self.frame_skip_value = widget.get_value_as_int()
@@ -230,14 +361,59 @@ class framestop(Gtk.Window):
             self.input_entry.set_text(input_file_path)
             self.input_directory = os.path.dirname(input_file_path)
             self.start_loading_animation()
+            self.preview_max_size = self.get_preview_size() if self.proxy_preview else None
             # Load video frames in a separate thread to avoid freezing
-            thread = threading.Thread(target=self.load_video_frames, args=(input_file_path,))
-            thread.start()
+            self.load_job = LoadJob(
+                self.cache_size_mb * 1024 * 1024 // 2,
+                dedup=self.dedup_tolerance >= 0, dedup_tolerance=self.dedup_tolerance or None,
+            )
+            self.frame_cache = self.load_job.cache
+            self.load_job.start(self.load_video_frames, input_file_path, self.load_job)
             if self.output_auto:
                 self.output_entry.set_text(self.input_directory)
 
         dialog.destroy()
 
+    def get_preview_size(self):
+        # Frames are never shown larger than the monitor at zoom 1, so that is the proxy size
+        display = Gdk.Display.get_default()
+        window = self.get_window()
+        monitor = display.get_monitor_at_window(window) if window else display.get_primary_monitor()
+        if monitor is None:
+            return (1920, 1080)
+        geometry = monitor.get_geometry()
+        scale = monitor.get_scale_factor()
+        return (geometry.width * scale, geometry.height * scale)
+
+    def get_export_source(self, frame_source, job):
+        # Exports always use full resolution frames, the browsing source may be a proxy.
+        # Called on export threads, so opening the full resolution reader never blocks the window
+        if not frame_source.is_proxy:
+            return frame_source
+        with self.export_source_lock:
+            if job is not self.load_job:
+                raise ValueError("Another video was opened meanwhile")
+            if self.export_source is not None and self.export_source.path == frame_source.path:
+                return self.export_source
+        source = VideoFrameSource(frame_source.path)  # Outside the lock, the main thread may need it meanwhile
+        with self.export_source_lock:
+            if job is not self.load_job:
+                source.close()
+                raise ValueError("Another video was opened meanwhile")
+            if self.export_source is not None and self.export_source.path == frame_source.path:
+                source.close()  # Another export opened it first
+                return self.export_source
+            previous, self.export_source = self.export_source, source
+        if previous is not None:
+            previous.close()
+        return source
+
+    def close_export_source(self):
+        with self.export_source_lock:
+            if self.export_source is not None:
+                self.export_source.close()
+            self.export_source = None
+
     def start_loading_animation(self):
         self.loading_dots = 0
 
@@ -256,34 +432,180 @@ class framestop(Gtk.Window):
             self.loading_animation_id = None
         self.loading_label.set_text("")  # Clear the loading label    
 
-    def load_video_frames(self, input_file_path):
-        time.sleep(5)  # Simulate a long operation; remove or modify this in real usage
-        # Once loading is done, update the UI
-        GLib.idle_add(self.on_frames_loaded)
-
-    def load_video_frames(self, input_file):
+    def load_video_frames(self, input_file, job):
         if not input_file:
             print("No input file selected.")
-            self.stop_loading_animation()
+            GLib.idle_add(self.stop_loading_animation)
             return
         try:
-            self.video = VideoFileClip(input_file)
+            # Only the metadata is read here, frames are decoded on demand by index.
+            # Frame 0 is decoded right away so it can be shown as soon as possible.
+            with timing.stage("open_video"):
+                # Frames decoded in an earlier session are mapped from the frame store, no decoding needed
+                frame_source = framestore.open_store(input_file, self.preview_max_size) if self.frame_store_gb else None
+                if frame_source is None:
+                    frame_source = job.open(input_file, max_size=self.preview_max_size)
+                frame_source.get_frame(0)
         except Exception as e:
-            self.show_error_dialog("Error: Invalid video file selected.")
-            self.stop_loading_animation()
+            if not job.cancelled:
+                GLib.idle_add(self.on_video_load_failed, job)
             return
-        
-        self.frame_images.clear()
-        self.pixbuf_cache.clear()
+        GLib.idle_add(self.on_video_loaded, frame_source, job)
+        if isinstance(frame_source, framestore.MappedFrameSource):
+            self.update_job_status(job, f"Opened {frame_source.frame_count} decoded frames from the frame store.")
+            return
+        self.stream_video_frames(input_file, job)
+
+    def stream_video_frames(self, input_file, job):
+        # Keep decoding forward into the frame cache while it has room, reporting progress.
+        # With the frame store enabled every frame is decoded once and written to disk as well.
+        stream_source = job.open(input_file, max_size=self.preview_max_size)
+        frame_bytes = stream_source.width * stream_source.height * 3
+        store_writer = None
+        if self.frame_store_gb:
+            store_writer = framestore.create_writer(stream_source, self.preview_max_size, self.frame_store_gb * 1024 ** 3)
+        started = time.monotonic()
+        last_report = started
+        decoded = 0
+        try:
+            if store_writer is not None:
+                store_writer.write(0, stream_source.get_frame(0))
+            for frame_index in range(1, stream_source.frame_count):
+                if job.cancelled:
+                    return
+                if job.cache.current_bytes + frame_bytes > job.cache.max_bytes:
+                    if store_writer is None:
+                        break  # Decoding further would only evict frames decoded earlier
+                    stream_source.cache = None  # Only the store needs the rest, keep the cached frames
+                frame = stream_source.get_frame(frame_index)
+                if store_writer is not None:
+                    store_writer.write(frame_index, frame)
+                decoded += 1
+                now = time.monotonic()
+                if now - last_report >= 0.25:
+                    last_report = now
+                    percent = 100 * (frame_index + 1) // stream_source.frame_count
+                    self.update_job_status(job, f"Decoding frames: {percent}% ({decoded / (now - started):.0f} frames/s)")
+            if store_writer is not None:
+                store_writer.finish()
+                GLib.idle_add(self.on_frame_store_ready, input_file, job)
+                store_writer = None
+        finally:
+            stream_source.close()
+            if store_writer is not None:  # Cancelled or failed before the last frame
+                store_writer.abort()
+        if not job.cancelled:
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.update_job_status(job, f"Decoded {decoded + 1} of {stream_source.frame_count} frames ({decoded / elapsed:.0f} frames/s).")
+
+    def on_frame_store_ready(self, input_file, job):
+        # Swap the decoder for the mapped store: same frames, no decoding and no cache needed from now on
+        if job is not self.load_job or self.frame_source is None:
+            return
+        mapped_source = framestore.open_store(input_file, self.preview_max_size)
+        if mapped_source is None:
+            return
+        # The decoder is not closed here: a best-frame search may still be reading from it, and its
+        # ffmpeg process is closed when it is garbage collected
+        self.frame_source = mapped_source
+        self.frame_cache.clear()
 
-        for i, frame in enumerate(self.video.iter_frames()):
-            image = Image.fromarray(frame)
-            self.frame_images.append(image)
+    def on_video_load_failed(self, job):
+        if job is not self.load_job:
+            return
+        self.stop_loading_animation()
+        self.show_error_dialog("Error: Invalid video file selected.")
+
+    def on_video_loaded(self, frame_source, job):
+        if job is not self.load_job:  # Another file was selected or the inputs were cleared meanwhile
+            frame_source.close()
+            return
+        self.frame_source = frame_source
+        self.close_export_source()
+        self.prefetcher.cancel()
+        self.pixbuf_cache.clear()
+        self.score_cache = rating.ScoreCache()  # Replaced, not cleared: queued searches still hold the old one
+        self.frame_view.set_roi(None)
+        self.stop_loading_animation()
 
         self.frame_slider.get_adjustment().set_lower(0)
-        self.frame_slider.get_adjustment().set_upper(len(self.frame_images) - 1)
+        self.frame_slider.get_adjustment().set_upper(frame_source.frame_count - 1)
         self.frame_slider.set_value(0)
         self.update_frame_display(0)
+        self.start_sharpness_index()
+        self.start_scene_index()
+
+    def start_scene_index(self):
+        # Load the saved scene cuts of this video, or detect them in one pass over a tiny proxy
+        self.stop_scene_index()
+        self.scene_index = None
+        if self.frame_source is None or not self.use_scene_cuts:
+            return
+        self.scene_stop = threading.Event()
+        thread = threading.Thread(
+            target=self.load_scene_index, args=(self.frame_source.path, self.scene_stop), daemon=True
+        )
+        thread.start()
+
+    def stop_scene_index(self):
+        if self.scene_stop is not None:
+            self.scene_stop.set()
+            self.scene_stop = None
+
+    def load_scene_index(self, video_path, stop):
+        scene_index = load_or_detect(
+            video_path,
+            progress=lambda done, total: self.update_status(f"Detecting scene cuts: {100 * done // total}%"),
+            should_stop=stop.is_set,
+        )
+        if scene_index is not None and not stop.is_set():
+            GLib.idle_add(self.on_scene_index_ready, scene_index, stop)
+
+    def on_scene_index_ready(self, scene_index, stop):
+        if stop is self.scene_stop:
+            self.scene_index = scene_index
+            self.status_label.set_text(f"Found {len(scene_index.cuts)} scene cuts, best-frame search stays within the current shot.")
+
+    def start_sharpness_index(self):
+        # Load the saved scores of this video, or score every frame if enabled in Settings
+        self.stop_sharpness_index()
+        if self.frame_source is None:
+            return
+        self.index_stop = threading.Event()
+        thread = threading.Thread(
+            target=self.load_sharpness_index,
+            args=(self.frame_source.path, self.threshold, self.analysis_size, self.scorer, self.index_stop),
+            daemon=True,
+        )
+        thread.start()
+
+    def stop_sharpness_index(self):
+        if self.index_stop is not None:
+            self.index_stop.set()
+            self.index_stop = None
+
+    def load_sharpness_index(self, video_path, threshold, analysis_size, scorer, stop):
+        index = SharpnessIndex.load(video_path, threshold, analysis_size, scorer=scorer)
+        if index is None and self.build_sharpness_index:
+            # A separate reader, so the forward pass doesn't fight the slider for seeks
+            index_source = VideoFrameSource(video_path, max_size=self.preview_max_size)
+            try:
+                index = build_index(
+                    index_source, threshold, analysis_size, self.analysis_workers,
+                    progress=lambda done, total: self.update_status(f"Indexing frames: {100 * done // total}%"),
+                    should_stop=stop.is_set, scorer=scorer,
+                )
+            finally:
+                index_source.close()
+            if index is not None:
+                index.save(video_path)
+        if index is not None and not stop.is_set():
+            GLib.idle_add(self.on_sharpness_index_ready, index, stop)
+
+    def on_sharpness_index_ready(self, index, stop):
+        if stop is self.index_stop:
+            self.sharpness_index = index
+            self.status_label.set_text("Sharpness index ready, best-frame search uses saved scores.")
 
     def show_error_dialog(self, message):
         dialog = Gtk.MessageDialog(
@@ -306,81 +628,71 @@ class framestop(Gtk.Window):
 
     def on_frame_slider_changed(self, widget):
         self.current_frame = int(self.frame_slider.get_value())
-    
-        # Get the current scroll positions (horizontal and vertical adjustments)
-        hadjustment = self.frame_area.get_hadjustment()
-        vadjustment = self.frame_area.get_vadjustment()
-    
-        hvalue = hadjustment.get_value()
-        vvalue = vadjustment.get_value()
 
-        # Update the frame display
-        self.update_frame_display(self.current_frame)
+        # Update the frame display (the scroll position is kept, the frame keeps its size)
+        self.schedule_display()
 
-        # Restore the scroll positions
-        hadjustment.set_value(hvalue)
-        vadjustment.set_value(vvalue)
+    def schedule_display(self):
+        # Coalesce bursts of slider, zoom and resize events into one update of the latest state
+        if self.display_update_id is None:
+            self.display_update_id = GLib.idle_add(self.on_scheduled_display)
 
-    def update_frame_display(self, frame_index):
-        if not self.frame_images:
+    def on_scheduled_display(self):
+        self.display_update_id = None
+        self.update_frame_display(self.current_frame)
+        if self.frame_source is not None:
+            # Once the frame is up, get the next ones along the same direction and stride ready
+            self.prefetcher.moved(self.current_frame, self.frame_source.frame_count, self.frame_source)
+        return False
+
+    def prefetch_frame(self, frame_source, frame_index):
+        # Runs on the prefetch thread; the pixbuf is dropped if another video was opened meanwhile
+        if frame_source.representative(frame_index) in self.pixbuf_cache:
             return
+        pixbuf = pixbuf_from_frame(frame_source.get_frame(frame_index))
+        if frame_source is self.frame_source:
+            self.pixbuf_cache.put(frame_source.representative(frame_index), pixbuf)
 
-        frame_image = self.frame_images[frame_index]
-
-        # Calculate the scaled width and height
-        scaled_width = int(frame_image.width * self.scale_factor)
-        scaled_height = int(frame_image.height * self.scale_factor)
-
-        # Check if there's already a Gtk.Viewport inside the ScrolledWindow
-        viewport = self.frame_area.get_child()  # Get the Gtk.Viewport inside the ScrolledWindow
-        if viewport and viewport.get_children():
-            # If a Gtk.Image exists inside the Viewport, update its pixbuf
-            frame_image_widget = viewport.get_children()[0]
-        else:
-            # Create a new Gtk.Image if no widget exists yet
-            frame_image_widget = Gtk.Image()
-            self.frame_area.add(frame_image_widget)
-
-        # Create or retrieve the Pixbuf, cache it if necessary
-        if frame_index < len(self.pixbuf_cache):
-            pixbuf = self.pixbuf_cache[frame_index]
-        else:
-            # Convert the frame_image to a GdkPixbuf object
-            buffer = frame_image.tobytes()
-            pixbuf = GdkPixbuf.Pixbuf.new_from_data(
-                buffer,
-                GdkPixbuf.Colorspace.RGB,
-                False, 8,
-                frame_image.width, frame_image.height,
-                frame_image.width * 3
-            )
-            self.pixbuf_cache.append(pixbuf)
+    def update_frame_display(self, frame_index):
+        if self.frame_source is None:
+            return
 
-        # Scale the pixbuf to the new size
-        scaled_pixbuf = pixbuf.scale_simple(scaled_width, scaled_height, GdkPixbuf.InterpType.BILINEAR)
+        with timing.stage("update_frame_display"):
+            # Create or retrieve the Pixbuf, cache it if necessary; repeated frames share one
+            pixbuf = self.pixbuf_cache.get(self.frame_source.representative(frame_index))
+            if pixbuf is None:
+                # Convert the decoded frame to a GdkPixbuf object, no PIL image needed for display
+                pixbuf = pixbuf_from_frame(self.frame_source.get_frame(frame_index))
+                self.pixbuf_cache.put(self.frame_source.representative(frame_index), pixbuf)
 
-        # Update the Gtk.Image widget with the new scaled pixbuf
-        frame_image_widget.set_from_pixbuf(scaled_pixbuf)
+            # Zoom 1 shows the decoded frame pixel for pixel: a proxy already fits the monitor, and
+            # scaling it up to the video's own size would only blur the frames being compared
+            display_scale = self.scale_factor
 
-        # Ensure everything is visible
-        self.frame_area.show_all()
+            # The view scales and paints only the visible part, reusing zoomed-out renders
+            self.frame_view.set_frame(self.frame_source.representative(frame_index), pixbuf, display_scale)
+            self.frame_view.show()
 
     def on_zoom_in(self, widget):
         """ Zoom in by increasing the scale factor and updating the display. """
         self.scale_factor *= 1.1
-        self.update_frame_display(self.current_frame)
+        self.schedule_display()
 
     def on_zoom_out(self, widget):
         """ Zoom out by decreasing the scale factor and updating the display. """
         self.scale_factor /= 1.1
-        self.update_frame_display(self.current_frame)
+        self.schedule_display()
 
     def on_window_resize(self, widget, allocation):
         """ Handle window resize and adjust frame size accordingly. """
-        self.update_frame_display(self.current_frame)
+        # size-allocate also fires when nothing changed; only real resizes schedule an update
+        size = (allocation.width, allocation.height)
+        if size != self.frame_area_size:
+            self.frame_area_size = size
+            self.schedule_display()
 
     def on_take_screenshot(self, widget):
-        if not self.frame_images:
+        if self.frame_source is None:
             self.show_error_dialog("Error: Please select a proper video file.")
             return
 
@@ -393,57 +705,199 @@ class framestop(Gtk.Window):
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
-        selected_frame = self.frame_images[self.current_frame]
-        if self.optimize_checkbox.get_active():
-            old_frame = self.current_frame
+        old_frame = self.current_frame
+        optimize = self.optimize_checkbox.get_active()
+        # Taken now: settings, inputs and even the video may change while the job waits
+        frame_source, job = self.frame_source, self.load_job
+        search = self.search_settings() if optimize else None
+        export_settings = copy.copy(self.export_settings)
+
+        def take_screenshot():
+            # Runs on an export thread: best-frame search and encoding never block navigation
+            with timing.stage("screenshot"):
+                frame_index = self.getBestFrame(frame_source, old_frame, search) if optimize else old_frame
+                selected_frame = self.get_export_source(frame_source, job).get_frame(frame_index)
+                if job is not self.load_job:
+                    raise ValueError("Another video was opened meanwhile")  # Do not save it under the new video's folder
+                save_frame(selected_frame, output_folder, f"frame_{frame_index}", export_settings)
+            return frame_index
+
+        if optimize:
             self.update_status("Searching for the best frames...")
-            selected_frame, self.current_frame = self.getBestFrame()
-            selected_frame.save(os.path.join(output_folder, f"frame_{self.current_frame}.jpg"))
-            self.update_status(f"Screenshot saved. Best frame at {self.current_frame}th frame ({abs(old_frame - self.current_frame)} frame{'s' if abs(old_frame - self.current_frame) != 1 else ''} away)")
-            #TODO mover preview para o frame atual
+        future = self.export_queue.submit(
+            take_screenshot,
+            lambda frame_index, error: GLib.idle_add(self.on_screenshot_saved, job, old_frame, frame_index, optimize, error),
+            block=False,
+        )
+        if future is None:
+            self.update_status("Too many screenshots in progress, try again in a moment.")
+
+    def on_screenshot_saved(self, job, old_frame, frame_index, optimize, error):
+        if job is not self.load_job:  # Another file was selected or the inputs were cleared meanwhile
+            return
+        if error is not None:
+            self.status_label.set_text(f"Error saving screenshot: {error}")
+            return
+        if optimize:
+            self.status_label.set_text(f"Screenshot saved. Best frame at {frame_index}th frame ({abs(old_frame - frame_index)} frame{'s' if abs(old_frame - frame_index) != 1 else ''} away)")
+            self.move_to_found_frame(old_frame, frame_index)
         else:
-            selected_frame.save(os.path.join(output_folder, f"frame_{self.current_frame}.jpg"))
-            self.update_status(f"Screenshot of frame {self.current_frame} saved.")
-            print(f"Screenshot of frame {self.current_frame} saved.")
-
-    def neighbour_pixel_values(self,loaded_img, x,y):
-        cima = loaded_img[x,y-1]
-        direita = loaded_img[x+1, y]
-        baixo = loaded_img[x, y+1]
-        esquerda = loaded_img[x-1, y]
-        return [cima, direita, baixo, esquerda]
-
-    def imageRating(self,img):
-        largura, altura = img.size
-        loaded_img = img.load()
-        mudancas = 0
-        for linha in range(1, altura-1):
-            for coluna in range(1, largura-1):
-                if (linha%2 == 0 and coluna%2 == 0) or (linha%2 == 1 and coluna%2 == 1):
-                    for pixel in self.neighbour_pixel_values(loaded_img, coluna, linha):
-                        dE = get_delta_e(loaded_img[coluna, linha], pixel)
-                        if dE > self.threshold:
-                            mudancas += round(dE, 2)
-        return mudancas*2/(largura*altura) #como estamos filtrando metade dos pixels, multiplicamos por 2
-    
-    def getBestFrame(self):
+            self.status_label.set_text(f"Screenshot of frame {frame_index} saved.")
+            print(f"Screenshot of frame {frame_index} saved.")
+
+    def move_to_found_frame(self, old_frame, frame_index):
+        # Show the frame a search picked, as when the search blocked the window, unless the user moved on meanwhile
+        if self.current_frame == old_frame:
+            self.frame_slider.set_value(frame_index)
+
+    def on_extract_best_frames(self, widget):
+        if self.extract_stop is not None:  # The button cancels a running export
+            self.extract_stop.set()
+            self.update_status("Cancelling extraction...")
+            return
+        if self.frame_source is None:
+            self.show_error_dialog("Error: Please select a proper video file.")
+            return
+
+        output_folder = self.output_entry.get_text()
+
+        if not output_folder:
+            self.show_error_dialog("Error: Please select a proper output folder.")
+            return
+
+        segments = self.ask_extract_segments()
+        if segments is None:
+            return
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+
+        self.extract_stop = threading.Event()
+        self.extract_button.set_label("Cancel extraction")
+        self.extract_progress.set_fraction(0)
+        self.extract_progress.set_text(f"Extracting {len(segments)} frames")
+        self.extract_progress.show()
+        thread = threading.Thread(
+            target=self.extract_best_frames,
+            args=(self.frame_source.path, segments, output_folder, copy.copy(self.export_settings), self.extract_stop),
+            daemon=True,
+        )
+        thread.start()
+
+    def ask_extract_segments(self):
+        # Dialog to split the video into a number of segments or fixed time intervals
+        dialog = Gtk.Dialog(title="Extract best frames", transient_for=self, flags=0)
+        dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_OK, Gtk.ResponseType.OK)
+
+        grid3 = Gtk.Grid()
+        grid3.set_column_spacing(15)
+        grid3.set_row_spacing(15)
+        grid3.set_margin_top(15)
+        grid3.set_margin_bottom(15)
+        grid3.set_margin_start(15)
+        grid3.set_margin_end(15)
+        dialog.get_content_area().pack_start(grid3, False, False, 0)
+
+        # Best frame of each of N equal segments
+        count_radio = Gtk.RadioButton.new_with_label_from_widget(None, "Number of frames:")
+        grid3.attach(count_radio, 0, 0, 1, 1)
+        count_spin = Gtk.SpinButton(adjustment=Gtk.Adjustment(value=12, lower=1, upper=10000, step_increment=1, page_increment=10, page_size=0))
+        grid3.attach(count_spin, 1, 0, 1, 1)
+
+        # Best frame of every interval of the given length
+        interval_radio = Gtk.RadioButton.new_with_label_from_widget(count_radio, "One frame every (seconds):")
+        grid3.attach(interval_radio, 0, 1, 1, 1)
+        interval_spin = Gtk.SpinButton(adjustment=Gtk.Adjustment(value=10, lower=0.1, upper=3600, step_increment=1, page_increment=10, page_size=0), digits=1)
+        grid3.attach(interval_spin, 1, 1, 1, 1)
+
+        dialog.show_all()
+        response = dialog.run()
+        segments = None
+        if response == Gtk.ResponseType.OK:
+            if count_radio.get_active():
+                segments = bulk.split_segments(self.frame_source.frame_count, self.frame_source.fps, count=count_spin.get_value_as_int())
+            else:
+                segments = bulk.split_segments(self.frame_source.frame_count, self.frame_source.fps, interval=interval_spin.get_value())
+        dialog.destroy()
+        return segments
+
+    def extract_best_frames(self, video_path, segments, output_folder, export_settings, stop):
+        # One forward pass over the video; winners are written by the export queue while the pass goes on.
+        # A separate full resolution reader without cache: streaming the whole video would only evict the preview frames.
+        saved = []
+        error = None
+
+        def on_winner(segment_number, frame_index, score, frame):
+            saved.append(self.export_queue.submit(lambda: save_frame(frame, output_folder, f"frame_{frame_index}", export_settings)))
+
+        try:
+            extract_source = VideoFrameSource(video_path)
+            try:
+                bulk.best_frames(
+                    extract_source, segments, self.threshold, self.analysis_size, self.analysis_workers,
+                    self.sharpness_index, on_winner,
+                    scene_index=self.scene_index, scorer=self.scorer,
+                    progress=lambda done, total: GLib.idle_add(self.extract_progress.set_fraction, done / total),
+                    should_stop=stop.is_set,
+                )
+            finally:
+                extract_source.close()
+        except Exception as e:
+            error = e
+        concurrent.futures.wait(saved)
+        error = error or next((future.exception() for future in saved if future.exception() is not None), None)
+        GLib.idle_add(self.on_best_frames_extracted, len(saved), len(segments), output_folder, stop, error)
+
+    def on_best_frames_extracted(self, saved, total, output_folder, stop, error):
+        if stop is self.extract_stop:
+            self.extract_stop = None
+        self.extract_button.set_label("Extract best frames...")
+        self.extract_progress.hide()
+        if error is not None:
+            self.status_label.set_text(f"Error extracting frames: {error}")
+        elif stop.is_set():
+            self.status_label.set_text(f"Extraction cancelled, {saved} of {total} frames saved.")
+        else:
+            self.status_label.set_text(f"Extracted {total} best frames to {output_folder}.")
+
+    def roi_analysis_size(self, roi):
+        # Resolution at which the region is scored, from its size in the frames being scored
+        left, top, right, bottom = rating.crop_box(roi, (self.frame_source.width, self.frame_source.height))
+        return rating.roi_analysis_size((right - left, bottom - top), self.frame_analysis_value, self.analysis_workers, self.scorer)
+
+    def on_roi_changed(self, frame_view):
+        if frame_view.roi is None:
+            self.status_label.set_text("Scoring the whole frame.")
+        elif self.frame_source is not None:
+            width, height = self.roi_analysis_size(frame_view.roi)
+            self.status_label.set_text(f"Scoring only the selected region, at {width}x{height}. Click the frame to clear it.")
+
+    def search_settings(self):
+        # Everything a best-frame search reads, taken on the main thread when an export is requested
+        roi = self.frame_view.roi
+        return {
+            "window": self.frame_analysis_value,
+            "threshold": self.threshold,
+            "workers": self.analysis_workers,
+            "analysis_size": self.roi_analysis_size(roi) if roi is not None else self.analysis_size,
+            "sharpness_index": self.sharpness_index,
+            "scene_index": self.scene_index,
+            "scorer": self.scorer,
+            "score_cache": self.score_cache,
+            "roi": roi,
+        }
+
+    def getBestFrame(self, frame_source, frame_index, search):
         #TODO melhorar range de frames quando está perto do início ou fim
-        half_frames = self.frame_analysis_value // 2
-        start_frame = int(max(0, self.current_frame - half_frames))
-        end_frame = int(min(len(self.frame_images), self.current_frame + half_frames))
-        frames_to_analyze_array = list(range(start_frame, end_frame))
-        ratings = {}
-        for frame_index in frames_to_analyze_array:
-            copia = self.frame_images[frame_index].copy()
-            copia.thumbnail((100,100))
-            ratings[frame_index] = self.imageRating(copia)
-        best_frame_index = max(ratings, key=ratings.get)
-        return [self.frame_images[best_frame_index], best_frame_index]
+        with timing.stage("getBestFrame"):
+            best_frame_index, _ = rating.find_best_frame(frame_source, frame_index, **search)
+        return best_frame_index
 
     def on_add_frame(self, widget):
         # Move slider value forward by 1 frame
+        if self.frame_source is None:
+            return
         current_value = self.frame_slider.get_value()
-        self.frame_slider.set_value(min(current_value + self.frame_skip_value, len(self.frame_images) - 1))
+        self.frame_slider.set_value(min(current_value + self.frame_skip_value, self.frame_source.frame_count - 1))
 
     def on_remove_frame(self, widget):
         # Move slider value backward by 1 frame
@@ -521,8 +975,146 @@ class framestop(Gtk.Window):
         self.frame_skip_spinner.set_halign(Gtk.Align.CENTER)  # Center it
         self.frame_skip_spinner.set_size_request(100, 10)  # Adjust width as needed
         grid2.attach(self.frame_skip_spinner, 1, 3, 1, 1)  # Attach the spin button
-        
-        #TODO add the screenshot configurations here
+
+        # Label for the frame cache size
+        cache_size_label = Gtk.Label(label="Frame cache size (MB):")
+        grid2.attach(cache_size_label, 0, 4, 1, 1)
+
+        # SpinButton to set the memory ceiling for cached frames
+        self.cache_size_adj = Gtk.Adjustment(value=self.cache_size_mb, lower=64, upper=16384, step_increment=64, page_increment=512, page_size=0)
+        self.cache_size_spin = Gtk.SpinButton(adjustment=self.cache_size_adj)
+
+        self.cache_size_spin.set_halign(Gtk.Align.CENTER)  # Center it
+        self.cache_size_spin.set_size_request(100, 10)  # Adjust width as needed
+        grid2.attach(self.cache_size_spin, 1, 4, 1, 1)  # Attach the spin button
+
+        # Label for the number of analysis workers
+        workers_label = Gtk.Label(label="Analysis worker processes:")
+        grid2.attach(workers_label, 0, 5, 1, 1)
+
+        # SpinButton to set how many processes score frames in parallel
+        self.workers_adj = Gtk.Adjustment(value=self.analysis_workers, lower=1, upper=max(os.cpu_count() or 1, 1), step_increment=1, page_increment=4, page_size=0)
+        self.workers_spin = Gtk.SpinButton(adjustment=self.workers_adj)
+
+        self.workers_spin.set_halign(Gtk.Align.CENTER)  # Center it
+        self.workers_spin.set_size_request(100, 10)  # Adjust width as needed
+        grid2.attach(self.workers_spin, 1, 5, 1, 1)  # Attach the spin button
+
+        # Label for the sharpness index
+        sharpness_index_label = Gtk.Label(label="Sharpness index:")
+        grid2.attach(sharpness_index_label, 0, 6, 1, 1)
+
+        # Checkbox to score the whole video once and save the scores next to it
+        self.sharpness_index_cb = Gtk.CheckButton(label="Score all frames in the background and save them next to the video")
+        self.sharpness_index_cb.set_active(self.build_sharpness_index)
+        grid2.attach(self.sharpness_index_cb, 1, 6, 1, 1)
+
+        # Label for the proxy preview
+        proxy_preview_label = Gtk.Label(label="Preview resolution:")
+        grid2.attach(proxy_preview_label, 0, 7, 1, 1)
+
+        # Checkbox to browse a screen-sized proxy of large videos (applies to the next loaded video)
+        self.proxy_preview_cb = Gtk.CheckButton(label="Decode a screen-sized preview, full resolution only when exporting")
+        self.proxy_preview_cb.set_active(self.proxy_preview)
+        grid2.attach(self.proxy_preview_cb, 1, 7, 1, 1)
+
+        # Label for the screenshot format
+        export_format_label = Gtk.Label(label="Screenshot format:")
+        grid2.attach(export_format_label, 0, 8, 1, 1)
+
+        # Combo box to choose the screenshot format
+        self.export_format_combo = Gtk.ComboBoxText()
+        for format_name in FORMATS:
+            self.export_format_combo.append(format_name, format_name)
+        self.export_format_combo.set_active_id(self.export_settings.format)
+        self.export_format_combo.set_halign(Gtk.Align.CENTER)
+        grid2.attach(self.export_format_combo, 1, 8, 1, 1)
+
+        # Label for the screenshot quality
+        export_quality_label = Gtk.Label(label="Screenshot quality (JPEG/WebP):")
+        grid2.attach(export_quality_label, 0, 9, 1, 1)
+
+        # SpinButton to set the encoder quality
+        self.export_quality_adj = Gtk.Adjustment(value=self.export_settings.quality, lower=1, upper=100, step_increment=1, page_increment=10, page_size=0)
+        self.export_quality_spin = Gtk.SpinButton(adjustment=self.export_quality_adj)
+        self.export_quality_spin.set_halign(Gtk.Align.CENTER)  # Center it
+        self.export_quality_spin.set_size_request(100, 10)  # Adjust width as needed
+        grid2.attach(self.export_quality_spin, 1, 9, 1, 1)
+
+        # Label for the screenshot compression level
+        export_compression_label = Gtk.Label(label="Compression level (PNG/WebP):")
+        grid2.attach(export_compression_label, 0, 10, 1, 1)
+
+        # SpinButton to set the encoder compression level
+        self.export_compression_adj = Gtk.Adjustment(value=self.export_settings.compression, lower=0, upper=9, step_increment=1, page_increment=3, page_size=0)
+        self.export_compression_spin = Gtk.SpinButton(adjustment=self.export_compression_adj)
+        self.export_compression_spin.set_halign(Gtk.Align.CENTER)  # Center it
+        self.export_compression_spin.set_size_request(100, 10)  # Adjust width as needed
+        grid2.attach(self.export_compression_spin, 1, 10, 1, 1)
+
+        # Label for scene-cut detection
+        scene_cuts_label = Gtk.Label(label="Scene cuts:")
+        grid2.attach(scene_cuts_label, 0, 11, 1, 1)
+
+        # Checkbox to keep best-frame searches within the current shot
+        self.scene_cuts_cb = Gtk.CheckButton(label="Keep best-frame searches within the current shot")
+        self.scene_cuts_cb.set_active(self.use_scene_cuts)
+        grid2.attach(self.scene_cuts_cb, 1, 11, 1, 1)
+
+        # Label for the sharpness metric
+        scorer_label = Gtk.Label(label="Sharpness metric:")
+        grid2.attach(scorer_label, 0, 12, 1, 1)
+
+        # Combo box to trade accuracy for speed
+        self.scorer_combo = Gtk.ComboBoxText()
+        for scorer in rating.SCORERS.values():
+            self.scorer_combo.append(scorer.name, scorer.label)
+        self.scorer_combo.set_active_id(self.scorer)
+        self.scorer_combo.set_halign(Gtk.Align.CENTER)
+        grid2.attach(self.scorer_combo, 1, 12, 1, 1)
+
+        # Label for the stage timings
+        record_timings_label = Gtk.Label(label="Diagnostics:")
+        grid2.attach(record_timings_label, 0, 13, 1, 1)
+
+        # Checkbox to record how long each stage takes
+        self.record_timings_cb = Gtk.CheckButton(label="Record stage timings (shown in Diagnostics)")
+        self.record_timings_cb.set_active(self.record_timings)
+        grid2.attach(self.record_timings_cb, 1, 13, 1, 1)
+
+        # Label for the on-disk frame store
+        frame_store_label = Gtk.Label(label="Frame store on disk (GB, 0 = off):")
+        grid2.attach(frame_store_label, 0, 14, 1, 1)
+
+        # SpinButton to set the size cap of the frame store folder
+        self.frame_store_adj = Gtk.Adjustment(value=self.frame_store_gb, lower=0, upper=1024, step_increment=1, page_increment=10, page_size=0)
+        self.frame_store_spin = Gtk.SpinButton(adjustment=self.frame_store_adj)
+        self.frame_store_spin.set_halign(Gtk.Align.CENTER)  # Center it
+        self.frame_store_spin.set_size_request(100, 10)  # Adjust width as needed
+        grid2.attach(self.frame_store_spin, 1, 14, 1, 1)
+
+        # Label for merging repeated frames
+        dedup_label = Gtk.Label(label="Duplicate frames (-1 = keep, 0 = identical, N = bits):")
+        grid2.attach(dedup_label, 0, 15, 1, 1)
+
+        # SpinButton to set how different two neighbouring frames may be and still count as one
+        # (only if their detail matches too, so a sharp frame is never merged into a blurry one)
+        self.dedup_adj = Gtk.Adjustment(value=self.dedup_tolerance, lower=-1, upper=16, step_increment=1, page_increment=4, page_size=0)
+        self.dedup_spin = Gtk.SpinButton(adjustment=self.dedup_adj)
+        self.dedup_spin.set_halign(Gtk.Align.CENTER)  # Center it
+        self.dedup_spin.set_size_request(100, 10)  # Adjust width as needed
+        grid2.attach(self.dedup_spin, 1, 15, 1, 1)
+
+        # Label for prefetching frames while stepping through the video
+        prefetch_label = Gtk.Label(label="Frames to prefetch (0 = off):")
+        grid2.attach(prefetch_label, 0, 16, 1, 1)
+
+        # SpinButton to set how many frames ahead are prepared in the background
+        self.prefetch_adj = Gtk.Adjustment(value=self.prefetch_depth, lower=0, upper=16, step_increment=1, page_increment=4, page_size=0)
+        self.prefetch_spin = Gtk.SpinButton(adjustment=self.prefetch_adj)
+        self.prefetch_spin.set_halign(Gtk.Align.CENTER)  # Center it
+        self.prefetch_spin.set_size_request(100, 10)  # Adjust width as needed
+        grid2.attach(self.prefetch_spin, 1, 16, 1, 1)
 
         # Show the dialog with its contents
         dialog.show_all()
@@ -531,12 +1123,110 @@ class framestop(Gtk.Window):
         response = dialog.run()
 
         if response == Gtk.ResponseType.OK:
+            index_settings = (self.threshold, self.build_sharpness_index, self.scorer)
             self.frame_analysis_value = self.frame_analysis_spin.get_value_as_int()
             self.threshold = self.threshold_spin.get_value_as_int()
             self.frame_skip_value=self.frame_skip_spinner.get_value_as_int()
+            self.set_cache_size(self.cache_size_spin.get_value_as_int())
+            self.analysis_workers = self.workers_spin.get_value_as_int()
+            self.build_sharpness_index = self.sharpness_index_cb.get_active()
+            self.proxy_preview = self.proxy_preview_cb.get_active()
+            self.scorer = self.scorer_combo.get_active_id()
+            self.record_timings = self.record_timings_cb.get_active()
+            if self.frame_store_spin.get_value_as_int() < self.frame_store_gb:
+                framestore.evict(self.frame_store_spin.get_value_as_int() * 1024 ** 3)
+            self.frame_store_gb = self.frame_store_spin.get_value_as_int()
+            self.dedup_tolerance = self.dedup_spin.get_value_as_int()  # Applies to the next opened video
+            self.prefetch_depth = self.prefetcher.depth = self.prefetch_spin.get_value_as_int()
+            timing.enable(self.record_timings)
+            self.export_settings = ExportSettings(
+                self.export_format_combo.get_active_id(),
+                self.export_quality_spin.get_value_as_int(),
+                self.export_compression_spin.get_value_as_int(),
+            )
+            # The saved scores depend on the threshold and metric, so look them up again
+            if (self.threshold, self.build_sharpness_index, self.scorer) != index_settings:
+                self.score_cache.clear()  # Keyed by these settings anyway, the old entries would only take room
+                self.start_sharpness_index()
+            if self.scene_cuts_cb.get_active() != self.use_scene_cuts:
+                self.use_scene_cuts = self.scene_cuts_cb.get_active()
+                self.start_scene_index()
 
         dialog.destroy()
 
+    def set_cache_size(self, size_mb):
+        self.cache_size_mb = size_mb
+        tier_bytes = size_mb * 1024 * 1024 // 2
+        self.frame_cache.set_max_bytes(tier_bytes)
+        self.pixbuf_cache.set_max_bytes(tier_bytes)
+
+    def on_open_diagnostics(self, widget):
+        # Table of the stage timings recorded so far, with reset and JSON export
+        dialog = Gtk.Dialog(title="Diagnostics", transient_for=self, flags=0)
+        dialog.add_buttons("Reset", Gtk.ResponseType.REJECT, "Export JSON...", Gtk.ResponseType.APPLY, Gtk.STOCK_CLOSE, Gtk.ResponseType.CLOSE)
+        dialog.set_default_size(640, 320)
+
+        columns = ["Stage", "Count", "Total (ms)", "Mean (ms)", "p50 (ms)", "p90 (ms)", "p99 (ms)", "Max (ms)"]
+        store = Gtk.ListStore(str, int, *[str] * 6)
+        tree = Gtk.TreeView(model=store)
+        for column_index, title in enumerate(columns):
+            tree.append_column(Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=column_index))
+
+        def fill():
+            store.clear()
+            for name, stats in timing.summary().items():
+                store.append([name, stats["count"]] + [f"{stats[key]:.2f}" for key in ("total_ms", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms")])
+
+        fill()
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_vexpand(True)
+        scrolled.add(tree)
+        content_area = dialog.get_content_area()
+        if not timing.enabled:
+            content_area.pack_start(Gtk.Label(label="Timings are not being recorded, enable them in Settings."), False, False, 5)
+        content_area.pack_start(scrolled, True, True, 0)
+        content_area.pack_start(Gtk.Label(label=f"Frame cache: {self.frame_cache.stats()}"), False, False, 5)
+        content_area.pack_start(Gtk.Label(label=f"Pixbuf cache: {self.pixbuf_cache.stats()}"), False, False, 5)
+        content_area.pack_start(Gtk.Label(label=f"Score cache: {self.score_cache.stats()}"), False, False, 5)
+        content_area.pack_start(Gtk.Label(label=f"Prefetch: {self.prefetcher.stats()}"), False, False, 5)
+        if self.load_job is not None and self.load_job.dedup is not None:
+            content_area.pack_start(Gtk.Label(label=f"Repeated frames: {self.load_job.dedup.stats()}"), False, False, 5)
+        dialog.show_all()
+
+        while True:
+            response = dialog.run()
+            if response == Gtk.ResponseType.REJECT:
+                timing.reset()
+                fill()
+            elif response == Gtk.ResponseType.APPLY:
+                self.export_timings(dialog)
+            else:
+                break
+        dialog.destroy()
+
+    def export_timings(self, parent):
+        chooser = Gtk.FileChooserDialog(title="Export timings", parent=parent, action=Gtk.FileChooserAction.SAVE)
+        chooser.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        chooser.set_do_overwrite_confirmation(True)
+        chooser.set_current_name("framestop-timings.json")
+        if chooser.run() == Gtk.ResponseType.OK:
+            video = None
+            if self.frame_source is not None:
+                video = {
+                    "path": self.frame_source.path,
+                    "size": [self.frame_source.source_width, self.frame_source.source_height],
+                    "preview_size": [self.frame_source.width, self.frame_source.height],
+                    "fps": self.frame_source.fps,
+                    "frame_count": self.frame_source.frame_count,
+                }
+            timing.export_json(
+                chooser.get_filename(), video=video, scorer=self.scorer,
+                frame_cache=self.frame_cache.stats(), pixbuf_cache=self.pixbuf_cache.stats(),
+                score_cache=self.score_cache.stats(),
+            )
+            self.status_label.set_text(f"Timings exported to {chooser.get_filename()}.")
+        chooser.destroy()
+
     def on_about_button_clicked(self, widget):
          # Create the About dialog
         about_dialog = Gtk.Dialog(title="About Screenshot Optimizer", transient_for=self, flags=0)
@@ -612,11 +1302,30 @@ class framestop(Gtk.Window):
         self.threshold_value = (widget.get_value())/10
         print(f"Threshold set at: {self.threshold_value}")
 
+def report_startup_time(widget, cr):
+    # --startup-time: print the time from process start (module load off Linux) to the first drawn window, then quit
+    print(f'{{"time_to_window_ms": {(time.perf_counter() - STARTED) * 1000:.1f}}}', flush=True)
+    GLib.idle_add(Gtk.main_quit)
+    return False
+
+def start_warm_up():
+    # The video decoder stack is imported in the background once the window is up
+    threading.Thread(target=frames.warm_up, daemon=True).start()
+    return False
+
 def main():
+    if not Gtk.init_check():
+        print("Failed to initialize GTK.")
+        exit(1)
     app = framestop()
     app.connect("destroy", Gtk.main_quit)
+    if "--startup-time" in sys.argv:
+        app.connect("draw", report_startup_time)
     app.show_all()
+    GLib.idle_add(start_warm_up)
     Gtk.main()
+    app.export_queue.shutdown(wait=True)  # Let queued screenshots finish writing
+    rating.shutdown_pool()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+"""Decoded frames kept on disk and memory-mapped when a video is reopened.
+
+The first time a video is browsed, its frames (usually at preview
+resolution) are written as they are decoded into one contiguous
+frames x height x width x 3 uint8 file in the user cache folder, after a
+small JSON header. Later sessions map that file: getting a frame is a slice,
+with no decoding, and the pages belong to the file rather than to the
+process, so the OS can drop them under memory pressure.
+
+Stores are named after the video's content hash and the preview size, and
+the folder is kept under a size cap by deleting the least recently opened
+stores first.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from sharpness import video_hash
+
+MAGIC = b"FRAMESTOP-FRAMES1"
+HEADER_BYTES = 4096  # Magic, header length and JSON metadata, zero padded; frames start after it
+EXTENSION = ".frames"
+
+
+def cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "framestop", "frames")
+
+
+def store_path(content_hash, max_size):
+    size_key = f"{max_size[0]}x{max_size[1]}" if max_size is not None else "full"
+    return os.path.join(cache_dir(), f"{content_hash}_{size_key}{EXTENSION}")
+
+
+def store_bytes(frame_source):
+    return HEADER_BYTES + frame_source.frame_count * frame_source.width * frame_source.height * 3
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a frame store")
+        length = int.from_bytes(f.read(4), "little")
+        return json.loads(f.read(length))
+
+
+def _write_header(f, meta):
+    header = json.dumps(meta).encode()
+    if len(MAGIC) + 4 + len(header) > HEADER_BYTES:
+        raise ValueError("Frame store header too large")
+    f.write(MAGIC + len(header).to_bytes(4, "little") + header)
+
+
+class MappedFrameSource:
+    """Frames of a video read from a frame store, with the interface of `frames.VideoFrameSource`."""
+
+    def __init__(self, path, store_file):
+        meta = _read_header(store_file)
+        self.path = path
+        self.store_file = store_file
+        self.cache = None
+        self.fps = meta["fps"]
+        self.frame_count = meta["frame_count"]
+        self.width, self.height = meta["width"], meta["height"]
+        self.source_width, self.source_height = meta["source_width"], meta["source_height"]
+        self.is_proxy = (self.width, self.height) != (self.source_width, self.source_height)
+        self.frames = np.memmap(
+            store_file, dtype=np.uint8, mode="r", offset=HEADER_BYTES,
+            shape=(self.frame_count, self.height, self.width, 3),
+        )
+        os.utime(store_file)  # Eviction removes the least recently opened stores first
+
+    def __len__(self):
+        return self.frame_count
+
+    def get_frame(self, index):
+        """Return frame `index` as a read-only (H, W, 3) uint8 array backed by the store."""
+        if not 0 <= index < self.frame_count:
+            raise IndexError(f"Frame {index} out of range (0-{self.frame_count - 1})")
+        frames = self.frames
+        if frames is None:
+            raise ValueError(f"{self.path} was closed")  # Same as VideoFrameSource
+        return frames[index]
+
+    def get_image(self, index):
+        return Image.fromarray(self.get_frame(index))
+
+    def representative(self, index):
+        return index
+
+    def close(self):
+        self.frames = None  # The mapping is released with the last reference to it
+
+
+def open_store(video_path, max_size, content_hash=None):
+    """MappedFrameSource of a complete store for this video and preview size, or None."""
+    try:
+        store_file = store_path(content_hash or video_hash(video_path), max_size)
+        return MappedFrameSource(video_path, store_file)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class FrameStoreWriter:
+    """Fills a new store frame by frame; it only becomes visible to `open_store` after `finish()`."""
+
+    def __init__(self, frame_source, max_size, content_hash=None):
+        self.frame_source = frame_source
+        self.path = store_path(content_hash or video_hash(frame_source.path), max_size)
+        self.partial_path = self.path + ".partial"
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        meta = {
+            "fps": frame_source.fps,
+            "frame_count": frame_source.frame_count,
+            "width": frame_source.width,
+            "height": frame_source.height,
+            "source_width": frame_source.source_width,
+            "source_height": frame_source.source_height,
+        }
+        with open(self.partial_path, "wb") as f:
+            _write_header(f, meta)
+            f.truncate(store_bytes(frame_source))  # Sparse until the frames are written
+        self.frames = np.memmap(
+            self.partial_path, dtype=np.uint8, mode="r+", offset=HEADER_BYTES,
+            shape=(frame_source.frame_count, frame_source.height, frame_source.width, 3),
+        )
+        self.written = 0
+
+    def write(self, index, frame):
+        self.frames[index] = frame
+        self.written += 1
+
+    def finish(self):
+        """Flush the frames and publish the store; returns its path."""
+        if self.written < self.frame_source.frame_count:
+            self.abort()
+            raise ValueError(f"Only {self.written} of {self.frame_source.frame_count} frames were written")
+        self.frames.flush()
+        self.frames = None
+        os.replace(self.partial_path, self.path)
+        return self.path
+
+    def abort(self):
+        self.frames = None
+        try:
+            os.remove(self.partial_path)
+        except OSError:
+            pass
+
+
+def evict(max_bytes):
+    """Delete the least recently opened stores until the folder holds at most `max_bytes`."""
+    stores = []
+    for path in glob.glob(os.path.join(cache_dir(), "*" + EXTENSION)):
+        try:
+            info = os.stat(path)
+        except OSError:
+            continue
+        stores.append((info.st_mtime, info.st_size, path))
+    total = sum(size for _, size, _ in stores)
+    for _, size, path in sorted(stores):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+def create_writer(frame_source, max_size, max_bytes, content_hash=None):
+    """A FrameStoreWriter for this video if its store fits in `max_bytes`, evicting older stores to make room."""
+    needed = store_bytes(frame_source)
+    if needed > max_bytes:
+        return None
+    evict(max_bytes - needed)
+    return FrameStoreWriter(frame_source, max_size, content_hash)
@@ -0,0 +1,155 @@
+"""Widget that paints the current frame at the current zoom level.
+
+Only the part of the frame visible in the surrounding ScrolledWindow is
+painted: GTK clips every draw to the exposed area and cairo only resamples
+the pixels inside the clip. Zoomed-out renders are small, so they are kept
+per (frame, scale) pair and reused; zoomed-in renders are never built for the
+whole frame, the visible area is scaled from the frame on each draw instead.
+
+Dragging over the frame draws a region of interest, kept as fractions of the
+frame so it does not depend on the zoom or on the preview resolution; a click
+without dragging removes it.
+"""
+import cairo
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk, Gdk, GdkPixbuf, GObject
+
+from frames import FrameCache
+
+SCALED_CACHE_BYTES = 64 * 1024 * 1024
+MIN_ROI_DRAG = 8  # Screen pixels; shorter drags are clicks and clear the region
+
+
+def surface_from_pixbuf(pixbuf):
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, pixbuf.get_width(), pixbuf.get_height())
+    cr = cairo.Context(surface)
+    Gdk.cairo_set_source_pixbuf(cr, pixbuf, 0, 0)
+    cr.paint()
+    return surface
+
+
+class FrameView(Gtk.DrawingArea):
+
+    __gsignals__ = {"roi-changed": (GObject.SignalFlags.RUN_FIRST, None, ())}
+
+    def __init__(self):
+        super().__init__()
+        self.frame_key = None
+        self.pixbuf = None
+        self.display_scale = 1.0  # Screen pixels per pixbuf pixel
+        self.roi = None  # (left, top, right, bottom) as fractions of the frame
+        self._drag_start = None
+        self._drag_end = None
+        self._surface = None  # Unscaled cairo surface of self.pixbuf, built on the first zoomed-in draw
+        self._scaled_cache = FrameCache(SCALED_CACHE_BYTES, sizeof=lambda surface: surface.get_stride() * surface.get_height())
+        self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.BUTTON_RELEASE_MASK | Gdk.EventMask.BUTTON1_MOTION_MASK)
+        self.connect("draw", self.on_draw)
+        self.connect("button-press-event", self.on_button_press)
+        self.connect("motion-notify-event", self.on_motion)
+        self.connect("button-release-event", self.on_button_release)
+
+    def set_frame(self, frame_key, pixbuf, display_scale):
+        """Show `pixbuf` (identified by `frame_key`) scaled by `display_scale`."""
+        if frame_key != self.frame_key or pixbuf is not self.pixbuf:
+            self.frame_key = frame_key
+            self.pixbuf = pixbuf
+            self._surface = None
+        self.display_scale = display_scale
+        self.set_size_request(*self.scaled_size())
+        self.queue_draw()
+
+    def clear(self):
+        self.frame_key = None
+        self.pixbuf = None
+        self._surface = None
+        self._scaled_cache.clear()
+        self.set_roi(None)
+        self.set_size_request(-1, -1)
+        self.queue_draw()
+
+    def set_roi(self, roi):
+        if roi != self.roi:
+            self.roi = roi
+            self.queue_draw()
+            self.emit("roi-changed")
+
+    def scaled_size(self):
+        return (
+            max(1, int(self.pixbuf.get_width() * self.display_scale)),
+            max(1, int(self.pixbuf.get_height() * self.display_scale)),
+        )
+
+    def on_draw(self, widget, cr):
+        if self.pixbuf is None:
+            return False
+        cr.save()  # The zoom only applies to the frame, the region outline is in widget pixels
+        if self.display_scale <= 1:
+            cr.set_source_surface(self._scaled_surface(), 0, 0)
+        else:
+            if self._surface is None:
+                self._surface = surface_from_pixbuf(self.pixbuf)
+            cr.scale(self.display_scale, self.display_scale)
+            cr.set_source_surface(self._surface, 0, 0)
+            cr.get_source().set_filter(cairo.FILTER_BILINEAR)
+        cr.paint()  # Clipped to the visible area by GTK
+        cr.restore()
+        rectangle = self._roi_rectangle()
+        if rectangle is not None:
+            cr.rectangle(*rectangle)
+            cr.set_source_rgb(1, 0.8, 0)
+            cr.set_line_width(2)
+            cr.set_dash([6, 4])
+            cr.stroke()
+        return False
+
+    def _roi_rectangle(self):
+        """(x, y, width, height) in widget pixels of the region being dragged or set."""
+        if self._drag_end is not None:
+            (x0, y0), (x1, y1) = self._drag_start, self._drag_end
+        elif self.roi is not None:
+            width, height = self.scaled_size()
+            x0, y0, x1, y1 = self.roi[0] * width, self.roi[1] * height, self.roi[2] * width, self.roi[3] * height
+        else:
+            return None
+        return min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0)
+
+    def on_button_press(self, widget, event):
+        if self.pixbuf is None or event.button != 1:
+            return False
+        self._drag_start = self._clamp(event.x, event.y)
+        self._drag_end = None
+        return True
+
+    def on_motion(self, widget, event):
+        if self._drag_start is None:
+            return False
+        self._drag_end = self._clamp(event.x, event.y)
+        self.queue_draw()
+        return True
+
+    def on_button_release(self, widget, event):
+        if self._drag_start is None or event.button != 1:
+            return False
+        (x0, y0), (x1, y1) = self._drag_start, self._clamp(event.x, event.y)
+        self._drag_start = self._drag_end = None
+        if abs(x1 - x0) < MIN_ROI_DRAG or abs(y1 - y0) < MIN_ROI_DRAG:
+            self.set_roi(None)
+        else:
+            width, height = self.scaled_size()
+            self.set_roi((min(x0, x1) / width, min(y0, y1) / height, max(x0, x1) / width, max(y0, y1) / height))
+        self.queue_draw()
+        return True
+
+    def _clamp(self, x, y):
+        width, height = self.scaled_size()
+        return min(max(x, 0), width), min(max(y, 0), height)
+
+    def _scaled_surface(self):
+        key = (self.frame_key, round(self.display_scale, 4))
+        surface = self._scaled_cache.get(key)
+        if surface is None:
+            scaled_pixbuf = self.pixbuf.scale_simple(*self.scaled_size(), GdkPixbuf.InterpType.BILINEAR)
+            surface = surface_from_pixbuf(scaled_pixbuf)
+            self._scaled_cache.put(key, surface)
+        return surface
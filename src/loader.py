@@ -0,0 +1,64 @@
+"""Background loading of a video, one cancellable job per opened file.
+
+Every job has a generation number, its own frame cache and, unless disabled,
+a `dedup.FrameDeduplicator` shared by its readers. Results posted
+back to the GUI carry the job, so anything from a job that is no longer the
+current one is dropped. Its frames also land in a cache nobody reads anymore.
+`cancel()` closes every reader the job opened. That stops its ffmpeg
+processes as soon as the frame being decoded is done, instead of when the
+loop next checks the flag.
+"""
+import itertools
+import threading
+import traceback
+
+from dedup import FrameDeduplicator
+from frames import FrameCache, VideoFrameSource
+
+_generations = itertools.count(1)
+
+
+class LoadJob:
+
+    def __init__(self, cache_bytes, dedup=True, dedup_tolerance=None):
+        self.generation = next(_generations)
+        self.cache = FrameCache(cache_bytes)
+        self.dedup = FrameDeduplicator(dedup_tolerance) if dedup else None
+        self._cancelled = threading.Event()
+        self._sources = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def open(self, path, **kwargs):
+        """Open a VideoFrameSource on this job's cache; it is closed when the job is cancelled."""
+        source = VideoFrameSource(path, cache=self.cache, dedup=self.dedup, **kwargs)
+        with self._lock:
+            if self.cancelled:
+                source.close()
+                raise ValueError(f"Load of {path} was cancelled")
+            self._sources.append(source)
+        return source
+
+    def start(self, target, *args):
+        """Run `target(*args)` on a daemon thread; errors after a cancel are expected and ignored."""
+        def run():
+            try:
+                target(*args)
+            except Exception:
+                if not self.cancelled:
+                    traceback.print_exc()
+
+        thread = threading.Thread(target=run, name=f"loader-{self.generation}", daemon=True)
+        thread.start()
+        return thread
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            sources, self._sources = self._sources, []
+        for source in sources:
+            source.close()
+        self.cache.clear()
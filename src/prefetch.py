@@ -0,0 +1,72 @@
+"""Preparation of the frames navigation is heading to, on a background thread.
+
+Every time a frame is shown, the prefetcher looks at the move that led to it
+(direction and stride, e.g. the "+N frames" step) and queues the next `depth`
+frames along the same line. A new move replaces whatever is still queued, so
+changing direction drops the stale work instead of finishing it first. Jumps
+longer than `max_step` are seeks, not stepping, and queue nothing.
+"""
+import threading
+import traceback
+
+
+class Prefetcher:
+    """Runs `prepare(context, index)` ahead of the navigation on one daemon thread.
+
+    `prepare` is expected to store its result itself (e.g. in a cache) and to
+    return quickly for frames that are already there. `context` is whatever
+    was passed to `moved`, typically the frame source the indices belong to.
+    """
+
+    def __init__(self, prepare, depth=4, max_step=120):
+        self.prepare = prepare
+        self.depth = depth
+        self.max_step = max_step
+        self.prepared = 0
+        self._pending = []  # (context, index), nearest first
+        self._last = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def moved(self, index, frame_count, context=None):
+        """Frame `index` is now shown; queue the next frames in the direction and stride of the last move."""
+        with self._condition:
+            last, self._last = self._last, index
+            if last is None or index == last:
+                return
+            step = index - last
+            self._pending = []
+            if self.depth <= 0 or abs(step) > self.max_step:
+                return
+            targets = (index + step * k for k in range(1, self.depth + 1))
+            self._pending = [(context, target) for target in targets if 0 <= target < frame_count]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self):
+        """Drop the queued frames and forget the last position, e.g. when another video is opened."""
+        with self._condition:
+            self._pending = []
+            self._last = None
+
+    def stats(self):
+        with self._condition:
+            return {"depth": self.depth, "queued": len(self._pending), "prepared": self.prepared}
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                context, index = self._pending.pop(0)
+            try:
+                self.prepare(context, index)
+            except ValueError:
+                pass  # The frame source was closed by a newer load job meanwhile
+            except Exception:
+                traceback.print_exc()
+            else:
+                with self._condition:
+                    self.prepared += 1
@@ -0,0 +1,105 @@
+"""Scene-cut index: where the shots of a video start.
+
+A best-frame window that crosses a cut can return a frame of another shot, so
+searches are clipped to the shot of the frame they start from. Cuts are found
+in one forward pass over a tiny proxy of the video (ffmpeg scales the frames,
+so decoding is cheap) by comparing the color histograms of consecutive
+frames. The result is saved in the video's sidecar file next to the sharpness
+scores.
+"""
+import numpy as np
+
+from frames import VideoFrameSource
+from sharpness import load_sidecar_array, save_sidecar_array, video_hash
+
+CUT_THRESHOLD = 0.35  # Histogram distance (0-1) between consecutive frames that counts as a cut
+DETECTION_SIZE = (128, 72)
+_BINS = 16
+
+
+def frame_histogram(frame):
+    """Normalized 16-bin histogram of each RGB channel, as one flat array."""
+    pixels = frame.reshape(-1, 3)
+    bins = (pixels >> 4).astype(np.intp) + np.arange(3) * _BINS  # Channel c uses bins c*16 .. c*16+15
+    return np.bincount(bins.ravel(), minlength=3 * _BINS) / len(pixels)
+
+
+def histogram_distance(a, b):
+    """Mean over the channels of the total variation distance, 0 (same) to 1 (disjoint)."""
+    return float(np.abs(a - b).sum()) / 6
+
+
+def _scenes_key(threshold):
+    return f"scenes_c{threshold:g}"
+
+
+class SceneIndex:
+    """Start frames of the shots of a video, for one cut threshold."""
+
+    def __init__(self, bounds, content_hash, threshold=CUT_THRESHOLD):
+        # Shot starts followed by the frame count, so shot i is bounds[i]:bounds[i + 1]
+        self.bounds = np.asarray(bounds, dtype=np.int64)
+        self.content_hash = content_hash
+        self.threshold = threshold
+
+    @property
+    def cuts(self):
+        return self.bounds[1:-1]
+
+    def matches(self, threshold):
+        return self.threshold == threshold
+
+    def shot_bounds(self, index):
+        """Return the [start, end) frame range of the shot containing frame `index`."""
+        shot = int(np.searchsorted(self.bounds, index, side="right")) - 1
+        shot = min(max(shot, 0), len(self.bounds) - 2)
+        return int(self.bounds[shot]), int(self.bounds[shot + 1])
+
+    @classmethod
+    def load(cls, video_path, threshold=CUT_THRESHOLD, content_hash=None):
+        """Return the saved index for this threshold, or None if there is none."""
+        content_hash = content_hash or video_hash(video_path)
+        bounds = load_sidecar_array(video_path, _scenes_key(threshold), content_hash)
+        if bounds is None:
+            return None
+        return cls(bounds, content_hash, threshold)
+
+    def save(self, video_path):
+        save_sidecar_array(video_path, _scenes_key(self.threshold), self.bounds, self.content_hash)
+
+
+def detect_scenes(video_path, threshold=CUT_THRESHOLD, progress=None, should_stop=None):
+    """Find the cuts of a video in one forward pass over a tiny proxy.
+
+    `progress(done, total)` is called every 64 frames; the pass is abandoned
+    (returning None) as soon as `should_stop()` returns True.
+    """
+    content_hash = video_hash(video_path)
+    frame_source = VideoFrameSource(video_path, max_size=DETECTION_SIZE)
+    try:
+        total = frame_source.frame_count
+        bounds = [0]
+        previous = None
+        for frame_index in range(total):
+            if should_stop is not None and should_stop():
+                return None
+            histogram = frame_histogram(frame_source.get_frame(frame_index))
+            if previous is not None and histogram_distance(previous, histogram) >= threshold:
+                bounds.append(frame_index)
+            previous = histogram
+            if progress is not None and (frame_index % 64 == 63 or frame_index == total - 1):
+                progress(frame_index + 1, total)
+    finally:
+        frame_source.close()
+    bounds.append(total)
+    return SceneIndex(bounds, content_hash, threshold)
+
+
+def load_or_detect(video_path, threshold=CUT_THRESHOLD, progress=None, should_stop=None):
+    """Saved scene index of the video, detecting and saving it first if there is none."""
+    scene_index = SceneIndex.load(video_path, threshold)
+    if scene_index is None:
+        scene_index = detect_scenes(video_path, threshold, progress, should_stop)
+        if scene_index is not None:
+            scene_index.save(video_path)
+    return scene_index
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""Long-running job server for best-frame extraction, no GTK required.
+
+Pipelines that submit clips continuously would otherwise start a process,
+import moviepy and spawn the scoring pool for every clip. The server does that
+once and keeps the pool warm, along with the scores of recently processed
+videos. A job is one video and the options of `framestop-batch`, as JSON, sent
+over HTTP on localhost or on a Unix socket:
+
+    framestop-server --port 8765
+    auth="Authorization: Bearer $(cat $XDG_RUNTIME_DIR/framestop-server.token)"
+    curl -H "$auth" -d '{"video": "/clips/a.mp4", "times": ["0:05", 12.5], "output": "/stills"}' localhost:8765/jobs
+    curl -H "$auth" 'localhost:8765/jobs/1?wait=60'
+    curl -H "$auth" localhost:8765/status
+
+    framestop-server --socket $XDG_RUNTIME_DIR/framestop.sock
+    curl --unix-socket $XDG_RUNTIME_DIR/framestop.sock -d @job.json http://localhost/jobs
+
+Jobs read videos and write images as the user running the server, so only
+that user may submit them. The Unix socket is created owner-only. Any local
+user can connect to a TCP port, so over TCP every request must carry the
+token the server writes, owner-only, to its token file at startup (a new one
+every start).
+
+Endpoints:
+
+    POST /jobs              queue a job; returns its id and the queue depth
+    GET /jobs/ID[?wait=S]   state, timings and, once finished, the batch-mode result
+    DELETE /jobs/ID         cancel a job that has not started yet
+    GET /status             queue depth, running and finished jobs, caches and stage timings
+"""
+import argparse
+import hmac
+import itertools
+import json
+import os
+import secrets
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import batch
+import frames
+import rating
+import timing
+from frames import FrameCache
+
+DEFAULT_PORT = 8765
+JOB_OPTIONS = {
+    "video", "frames", "times", "segments", "every", "output", "window", "threshold", "scorer",
+    "format", "quality", "compression", "index", "scenes", "dedup",
+}
+MAX_FINISHED = 1000  # Finished jobs kept for GET /jobs/ID, the oldest are forgotten first
+MAX_REQUEST_BYTES = 1024 * 1024
+MAX_WAIT = 600  # Seconds a GET /jobs/ID?wait= may block
+LIST_OPTIONS = {"frames", "times"}
+FLAG_OPTIONS = {"index", "scenes"}
+
+
+def default_token_file():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "framestop-server.token")
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "framestop", "server.token")
+
+
+def write_token(path):
+    """Write a new random token to `path`, readable by this user only, and return it."""
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        os.fchmod(fd, 0o600)  # The file may be older and less private
+        f.write(token + "\n")
+    return token
+
+
+def _reject(message):
+    raise ValueError(message)
+
+
+def job_argv(request):
+    """framestop-batch command line equivalent to a job request, so the batch parser checks every value."""
+    argv = []
+    for key, value in request.items():
+        if key == "video" or value is None:
+            continue
+        if key in FLAG_OPTIONS:
+            if not isinstance(value, bool):
+                raise ValueError(f"{key} must be true or false")
+            if value:
+                argv.append(f"--{key}")
+            continue
+        if isinstance(value, list) and key not in LIST_OPTIONS:
+            raise ValueError(f"{key} takes a single value")
+        values = value if isinstance(value, list) else [value]
+        if key in LIST_OPTIONS and not isinstance(value, list):
+            raise ValueError(f"{key} must be a list")
+        if any(isinstance(item, (bool, list, dict)) or item is None for item in values):
+            raise ValueError(f"Invalid value for {key}: {json.dumps(value)}")
+        if values:
+            argv += [f"--{key}", *map(str, values)]
+    return argv + ["--", request["video"]]
+
+
+class Job:
+
+    def __init__(self, job_id, video, args, request):
+        self.id = job_id
+        self.video = video
+        self.args = args
+        self.request = request
+        self.state = "queued"  # queued, running, done, failed or cancelled
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+
+    @property
+    def done(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def to_dict(self):
+        now = time.time()
+        info = {
+            "id": self.id,
+            "state": self.state,
+            "video": self.video,
+            "request": self.request,
+            "queued_s": (self.started or self.finished or now) - self.submitted,
+            "run_s": (self.finished or now) - self.started if self.started is not None else None,
+        }
+        if self.result is not None:
+            info["result"] = self.result
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+class JobServer:
+    """Queue of best-frame jobs run `jobs` at a time, sharing one scoring pool of `workers` processes."""
+
+    def __init__(self, jobs=2, workers=None, cached_videos=32):
+        self.jobs = jobs
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.started = time.time()
+        self._executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._ids = itertools.count(1)
+        self._changed = threading.Condition()
+        # One rating.ScoreCache per recently processed video, least recently used dropped first
+        self._score_caches = FrameCache(cached_videos, sizeof=lambda cache: 1)
+
+    def warm_up(self):
+        """Import the decoder and start every scoring process before the first job arrives."""
+        frames.warm_up()
+        rating.rate_frames_parallel(np.zeros((self.workers, 16, 16, 3), dtype=np.uint8), 5, self.workers)
+
+    def job_args(self, request):
+        """(video path, batch-mode options) of a job request; raises ValueError if the request is invalid."""
+        if not isinstance(request, dict):
+            raise ValueError("A job is a JSON object")
+        unknown = set(request) - JOB_OPTIONS
+        if unknown:
+            raise ValueError(f"Unknown job options: {', '.join(sorted(unknown))}")
+        video = request.get("video")
+        if not isinstance(video, str) or not os.path.isfile(video):
+            raise ValueError(f"No such video: {video}")
+        parser = batch.build_parser()
+        parser.error = _reject  # A bad request is a 400 reply, not an exit
+        args = parser.parse_args(job_argv(request))
+        if (args.segments or args.every) and (args.frames or args.times):
+            raise ValueError("segments and every cannot be combined with frames or times")
+        if not args.frames and not args.times and not args.segments and not args.every:
+            args.frames = [0]
+        args.output = os.path.abspath(args.output)
+        args.workers = self.workers  # Jobs share the pool warmed up with this many processes
+        return os.path.abspath(video), args
+
+    def submit(self, request):
+        video, args = self.job_args(request)
+        with self._changed:
+            job = Job(next(self._ids), video, args, request)
+            self._jobs[job.id] = job
+            self._forget_finished()
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id, wait=0):
+        """Job `job_id` (or None), after waiting up to `wait` seconds for it to finish."""
+        deadline = time.monotonic() + min(wait, MAX_WAIT)
+        with self._changed:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.done and time.monotonic() < deadline:
+                self._changed.wait(deadline - time.monotonic())
+            return job
+
+    def cancel(self, job_id):
+        """Cancel job `job_id` if it is still queued; returns the job, or None if there is no such job."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state == "queued" and job.future.cancel():
+                job.state = "cancelled"
+                job.finished = time.time()
+                self._changed.notify_all()
+            return job
+
+    def status(self):
+        with self._changed:
+            states = [job.state for job in self._jobs.values()]
+        report = {
+            "uptime_s": time.time() - self.started,
+            "jobs": self.jobs,
+            "workers": self.workers,
+            "queue_depth": states.count("queued"),
+            "running": states.count("running"),
+            "finished": {state: states.count(state) for state in ("done", "failed", "cancelled")},
+            "score_caches": self._score_caches.stats(),
+        }
+        if timing.enabled:
+            report["stages"] = timing.summary()
+        return report
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        rating.shutdown_pool()
+
+    def _score_cache(self, video):
+        # Keyed by size and mtime too, so a clip rewritten in place starts over
+        info = os.stat(video)
+        key = (video, info.st_size, info.st_mtime_ns)
+        cache = self._score_caches.get(key)
+        if cache is None:
+            cache = rating.ScoreCache()
+            self._score_caches.put(key, cache)
+        return cache
+
+    def _run(self, job):
+        with self._changed:
+            if job.state != "queued":
+                return
+            job.state = "running"
+            job.started = time.time()
+        try:
+            os.makedirs(job.args.output, exist_ok=True)
+            job.result = batch.process_video(job.video, job.args, self._score_cache(job.video))
+            state = "failed" if "error" in job.result else "done"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            state = "failed"
+        with self._changed:
+            job.state = state
+            job.finished = time.time()
+            self._changed.notify_all()
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self._jobs[job_id]
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "framestop-server"
+
+    @property
+    def job_server(self):
+        return self.server.job_server
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def send_json(self, status, body):
+        data = json.dumps(body, indent=2).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def authorized(self):
+        # Unix socket servers have no token: the socket file is owner-only
+        token = getattr(self.server, "token", None)
+        if token is None:
+            return True
+        given = self.headers.get("Authorization", "")
+        if hmac.compare_digest(given.encode(), f"Bearer {token}".encode()):
+            return True
+        self.send_json(401, {"error": "Missing or wrong token, see the server's --token-file"})
+        return False
+
+    def job_id(self, path):
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "jobs" and parts[1].isdigit():
+            return int(parts[1])
+        return None
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/status":
+            return self.send_json(200, self.job_server.status())
+        job_id = self.job_id(url.path)
+        if job_id is None:
+            return self.send_json(404, {"error": f"No such endpoint: {url.path}"})
+        try:
+            wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+        except ValueError:
+            return self.send_json(400, {"error": "wait must be a number of seconds"})
+        job = self.job_server.get(job_id, wait)
+        if job is None:
+            return self.send_json(404, {"error": f"No such job: {job_id}"})
+        self.send_json(200, job.to_dict())
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            return self.send_json(404, {"error": f"No such endpoint: {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self.send_json(400, {"error": "Invalid Content-Length"})
+        if length > MAX_REQUEST_BYTES:
+            return self.send_json(413, {"error": "Request too large"})
+        try:
+            job = self.job_server.submit(json.loads(self.rfile.read(length) or b"null"))
+        except ValueError as e:  # Includes JSON syntax errors
+            return self.send_json(400, {"error": str(e)})
+        self.send_json(202, {"id": job.id, "state": job.state, "queue_depth": self.job_server.status()["queue_depth"]})
+
+    def do_DELETE(self):
+        if not self.authorized():
+            return
+        job_id = self.job_id(urlparse(self.path).path)
+        job = self.job_server.cancel(job_id) if job_id is not None else None
+        if job is None:
+            return self.send_json(404, {"error": f"No such job: {self.path}"})
+        self.send_json(200 if job.state == "cancelled" else 409, job.to_dict())
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def open_unix_server(path):
+    # A socket file left by a server that died is reused; one that still answers is not
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path)
+        else:
+            raise OSError(f"{path} is in use by another server")
+        finally:
+            probe.close()
+    # Jobs write files as this user, so only this user may connect: the socket is created owner-only
+    umask = os.umask(0o077)
+    try:
+        return UnixHTTPServer(path, RequestHandler)
+    finally:
+        os.umask(umask)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="framestop-server",
+        description="Serve best-frame extraction jobs over localhost HTTP or a Unix socket.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"HTTP port (default: {DEFAULT_PORT})")
+    parser.add_argument("--socket", metavar="PATH", help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--token-file", metavar="PATH", default=default_token_file(),
+                        help="where to write the token TCP clients must send as 'Authorization: Bearer TOKEN' "
+                             "(default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=2, help="videos processed at the same time (default: 2)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for scoring, shared by all jobs (default: number of CPUs)")
+    parser.add_argument("--timings", action="store_true", help="record stage timings and report them in /status")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    timing.enable(args.timings)
+    job_server = JobServer(args.jobs, args.workers)
+    job_server.warm_up()
+    if args.socket:
+        httpd = open_unix_server(args.socket)
+    else:
+        httpd = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+        httpd.token = write_token(args.token_file)  # Any local user can connect to the port
+    httpd.job_server = job_server
+    # serve_forever returns once shutdown() is called from another thread
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+    where = args.socket or f"http://{args.host}:{httpd.server_address[1]}, token in {args.token_file}"
+    print(f"framestop-server listening on {where}", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        job_server.shutdown()
+        if args.socket:
+            try:
+                os.remove(args.socket)
+            except OSError:
+                pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""Per-video sharpness index, persisted as a sidecar file.
+
+Scoring every frame of a video once turns each later best-frame search into
+an argmax over a slice of an array. The scores are saved next to the video
+(`.<video name>.framestop.npz`, or in the user cache folder when the video's
+folder is read-only), keyed by a hash of the video content and by the scoring
+parameters, so reopening the same video skips scoring entirely. Other
+per-video indices (scene cuts) are stored in the same file.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+import rating
+import timing
+
+_SAMPLE_BYTES = 1024 * 1024
+_BATCH_FRAMES = 64
+_sidecar_lock = threading.Lock()  # Index, scene and server threads all add arrays to the same files
+
+
+def video_hash(path):
+    """Hash of the file size and of 1 MiB samples from its start, middle and end.
+
+    Hashing every byte of a multi-GB video would take longer than scoring it;
+    the sampled hash still changes whenever the file is re-encoded or edited.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        for offset in (0, max(0, size // 2 - _SAMPLE_BYTES // 2), max(0, size - _SAMPLE_BYTES)):
+            f.seek(offset)
+            digest.update(f.read(_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def _params_key(threshold, analysis_size, scorer=rating.DEFAULT_SCORER):
+    key = f"t{threshold:g}_a{analysis_size[0]}x{analysis_size[1]}"
+    # delta-E scores keep the key they had before other scorers existed
+    return key if scorer == rating.DEFAULT_SCORER else f"{key}_{scorer}"
+
+
+def sidecar_path(video_path):
+    folder, name = os.path.split(os.path.abspath(video_path))
+    if not os.access(folder, os.W_OK):
+        cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+        folder = os.path.join(cache_home, "framestop")
+    return os.path.join(folder, f".{name}.framestop.npz")
+
+
+def load_sidecar_array(video_path, key, content_hash):
+    """Return array `key` of the video's sidecar file, or None if it is missing or stale."""
+    try:
+        with np.load(sidecar_path(video_path)) as sidecar:
+            if str(sidecar["content_hash"]) != content_hash:
+                return None
+            return sidecar[key]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def save_sidecar_array(video_path, key, array, content_hash):
+    """Add array `key` to the video's sidecar file, keeping the other arrays of the same content."""
+    path = sidecar_path(video_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _sidecar_lock:
+        arrays = {}
+        try:
+            with np.load(path) as sidecar:
+                if str(sidecar["content_hash"]) == content_hash:
+                    arrays = {name: sidecar[name] for name in sidecar.files}
+        except (OSError, KeyError, ValueError):
+            pass
+        arrays["content_hash"] = np.array(content_hash)
+        arrays[key] = array
+
+        # A temp file of its own, so a writer in another process never publishes a half-written file
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+class SharpnessIndex:
+    """Scores of every frame of a video for one threshold, analysis size and scorer."""
+
+    def __init__(self, scores, content_hash, threshold, analysis_size, scorer=rating.DEFAULT_SCORER):
+        self.scores = np.asarray(scores, dtype=np.float64)
+        self.content_hash = content_hash
+        self.threshold = threshold
+        self.analysis_size = tuple(analysis_size)
+        self.scorer = scorer
+
+    def matches(self, threshold, analysis_size, scorer=rating.DEFAULT_SCORER):
+        return self.threshold == threshold and self.analysis_size == tuple(analysis_size) and self.scorer == scorer
+
+    def best_in(self, frame_indices):
+        """Return (index, score) of the highest scored frame among `frame_indices`."""
+        window = self.scores[frame_indices]
+        best = int(np.argmax(window))
+        return frame_indices[best], float(window[best])
+
+    @classmethod
+    def load(cls, video_path, threshold, analysis_size, content_hash=None, scorer=rating.DEFAULT_SCORER):
+        """Return the saved index for these parameters, or None if there is none."""
+        content_hash = content_hash or video_hash(video_path)
+        scores = load_sidecar_array(video_path, _params_key(threshold, analysis_size, scorer), content_hash)
+        if scores is None:
+            return None
+        return cls(scores, content_hash, threshold, analysis_size, scorer)
+
+    def save(self, video_path):
+        """Add these scores to the video's sidecar file, keeping other parameter sets."""
+        save_sidecar_array(
+            video_path, _params_key(self.threshold, self.analysis_size, self.scorer), self.scores.astype(np.float32),
+            self.content_hash,
+        )
+
+
+def build_index(frame_source, threshold, analysis_size=(100, 100), workers=None, progress=None, should_stop=None,
+                scorer=rating.DEFAULT_SCORER):
+    """Score every frame of `frame_source` in one forward pass.
+
+    `progress(done, total)` is called after each batch; the pass is abandoned
+    (returning None) as soon as `should_stop()` returns True. Repeated frames
+    (see `frames.VideoFrameSource.representative`) get their first copy's score.
+    """
+    content_hash = video_hash(frame_source.path)
+    total = frame_source.frame_count
+    scores = np.empty(total, dtype=np.float64)
+    representative = getattr(frame_source, "representative", lambda index: index)
+    batch = []  # (index, thumbnail)
+    repeats = []  # (index, representative), copied once the representative is scored
+    for frame_index in range(total):
+        if should_stop is not None and should_stop():
+            return None
+        copia = frame_source.get_image(frame_index)
+        key = representative(frame_index)
+        if key != frame_index:
+            repeats.append((frame_index, key))
+        else:
+            with timing.stage("thumbnail"):
+                copia.thumbnail(analysis_size)
+            batch.append((frame_index, rating.as_rgb_array(copia)))
+        if len(batch) == _BATCH_FRAMES or frame_index == total - 1:
+            if batch:
+                indices = [index for index, _ in batch]
+                scores[indices] = rating.rate_frames_parallel(np.stack([b[1] for b in batch]), threshold, workers, scorer)
+            for index, key in repeats:
+                scores[index] = scores[key]
+            batch, repeats = [], []
+            if progress is not None:
+                progress(frame_index + 1, total)
+    return SharpnessIndex(scores, content_hash, threshold, analysis_size, scorer)
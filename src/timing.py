@@ -0,0 +1,111 @@
+"""Per-stage timing of the decode, scoring, display and export paths.
+
+Off by default. When enabled, every `with timing.stage("decode"):` block
+records its wall time; `summary()` gives count, total and percentiles per
+stage and `export_json` writes them, with some context about the machine and
+the video, so a slow file can be attributed to a stage. Disabled stages cost
+one attribute lookup and a no-op context manager.
+"""
+import json
+import os
+import platform
+import threading
+import time
+from collections import deque
+
+MAX_SAMPLES = 10000  # Per stage, for the percentiles; count and total cover every call
+
+enabled = False
+_stages = {}
+_lock = threading.Lock()
+
+
+class _StageStats:
+    __slots__ = ("count", "total", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=MAX_SAMPLES)
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _Off:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_OFF = _Off()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def stage(name):
+    """Context manager timing one run of stage `name`, when timing is enabled."""
+    return _Timer(name) if enabled else _OFF
+
+
+def record(name, seconds):
+    with _lock:
+        stats = _stages.get(name)
+        if stats is None:
+            stats = _stages[name] = _StageStats()
+        stats.count += 1
+        stats.total += seconds
+        stats.samples.append(seconds)
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+def summary():
+    """{stage: {count, total_ms, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}}, slowest total first."""
+    import numpy as np
+    with _lock:
+        stages = {name: (stats.count, stats.total, np.array(stats.samples)) for name, stats in _stages.items()}
+    result = {}
+    for name, (count, total, samples) in sorted(stages.items(), key=lambda item: -item[1][1]):
+        p50, p90, p99 = np.percentile(samples, [50, 90, 99]) * 1000
+        result[name] = {
+            "count": count,
+            "total_ms": total * 1000,
+            "mean_ms": total * 1000 / count,
+            "p50_ms": float(p50),
+            "p90_ms": float(p90),
+            "p99_ms": float(p99),
+            "max_ms": float(samples.max()) * 1000,
+        }
+    return result
+
+
+def export_json(path, **info):
+    """Write the summary to `path`, with the machine and any `info` (e.g. the video) alongside."""
+    report = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        **info,
+        "stages": summary(),
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)